@@ -33,25 +33,61 @@ OCS脚本智能答题API - 多模型支持版本
 # ==================== 标准库导入 ====================
 import os
 import re
+import atexit
 import time
 import csv
+import codecs
 import base64
 import secrets
 import hashlib
 import json
 import logging
-from datetime import datetime
-from io import BytesIO
-from functools import wraps
-from collections import defaultdict
+import threading
+import bisect
+import tempfile
+from datetime import datetime, timedelta
+from io import BytesIO, TextIOWrapper
+from functools import wraps, lru_cache
+from collections import OrderedDict, Counter
 from typing import List, Dict, Any, Optional, Tuple
 
 # ==================== 第三方库导入 ====================
-from flask import Flask, request, jsonify, make_response, redirect, send_from_directory
+from flask import Flask, Response, request, jsonify, make_response, redirect, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from openai import OpenAI
 from dotenv import load_dotenv
 
+# 可选依赖：rapidfuzz（C++实现的模糊匹配，选项多或选项长时加速答案匹配）
+try:
+    from rapidfuzz import process as rf_process, fuzz as rf_fuzz
+    _HAS_RAPIDFUZZ = True
+except ImportError:
+    _HAS_RAPIDFUZZ = False
+
+# 可选依赖：numpy（CSV统计数据向量化计算）
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except ImportError:
+    _HAS_NUMPY = False
+
+# 可选依赖：orjson（C实现的JSON序列化，加速大量记录的接口响应）
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+# 可选依赖：pyarrow（C++实现的CSV解析，重新解析整个日志文件时使用）
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.compute as pa_compute
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
 # 加载环境变量
 load_dotenv()
 
@@ -128,6 +164,11 @@ DEBUG = os.getenv('DEBUG', 'False').lower() == 'true'
 SECRET_KEY_FILE = os.getenv('SECRET_KEY_FILE', '.secret_key')  # 密钥文件路径
 RATE_LIMIT_ATTEMPTS = int(os.getenv('RATE_LIMIT_ATTEMPTS', '5'))  # 允许的连续错误次数
 RATE_LIMIT_WINDOW = int(os.getenv('RATE_LIMIT_WINDOW', '300'))  # 限流时间窗口（秒）
+RATE_LIMIT_MAX_IPS = int(os.getenv('RATE_LIMIT_MAX_IPS', '10000'))  # 最多跟踪的IP数量（超出后淘汰最久未活动的IP）
+
+# -------------------- 批量答题配置 --------------------
+# 批量接口将多道题目合并为一次模型调用，分摊系统提示词和网络往返开销
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', '20'))  # 单次批量请求最多题目数
 
 # ==================== 配置区域结束 ====================
 
@@ -155,11 +196,76 @@ QUESTION_TYPE_MULTIPLE = 'multiple'
 QUESTION_TYPE_COMPLETION = 'completion'
 QUESTION_TYPE_JUDGEMENT = 'judgement'
 
+# 题型中文名称
+QUESTION_TYPE_NAMES = {
+    QUESTION_TYPE_SINGLE: '单选题',
+    QUESTION_TYPE_MULTIPLE: '多选题',
+    QUESTION_TYPE_JUDGEMENT: '判断题',
+    QUESTION_TYPE_COMPLETION: '填空题'
+}
+
 # 模型提供商常量
 PROVIDER_DEEPSEEK = 'deepseek'
 PROVIDER_DOUBAO = 'doubao'
 PROVIDER_AUTO = 'auto'
 
+# 各提供商每token费用（元），(输入, 输出)，按缓存未命中计
+# DeepSeek: 输入缓存命中0.2元/百万tokens，缓存未命中2元/百万tokens，输出3元/百万tokens
+# 豆包-Seed-1.6: 推理输入0.8元/百万tokens，推理输出2元/百万tokens
+_PROVIDER_RATES = {
+    PROVIDER_DEEPSEEK: (2.0e-6, 3.0e-6),
+    PROVIDER_DOUBAO: (0.8e-6, 2.0e-6)
+}
+# 未知提供商使用默认价格（参考DeepSeek）
+_DEFAULT_RATES = _PROVIDER_RATES[PROVIDER_DEEPSEEK]
+
+# 系统提示词消息（模块级常量，所有请求共享同一对象）
+# OpenAI SDK 不会修改传入的 messages，复用可减少每次请求的分配，
+# 同时保证系统前缀逐字节一致，便于服务端命中前缀缓存
+SYSTEM_MESSAGE_TEXT = {
+    "role": "system",
+    "content": "你是一个专业、严谨的答题助手。你必须根据题目和选项给出准确的答案，严格按照要求的格式输出，不要有任何多余的内容。"
+}
+SYSTEM_MESSAGE_MULTIMODAL = {
+    "role": "system",
+    "content": "你是一个专业、严谨的答题助手。你必须根据题目、图片和选项给出准确的答案，严格按照要求的格式输出，不要有任何多余的内容。"
+}
+
+# 选项字母标识（A-Z），构建prompt时按下标取用
+_OPT_LETTERS = tuple(chr(65 + i) for i in range(26))
+
+# ==================== 预编译正则 ====================
+# 答案处理和图片提取在每次请求中都会执行，预编译避免重复查找正则缓存
+
+# 答案前缀（如"答案："、"正确答案是"、"选择："），清洗答案时移除
+_RE_ANSWER_PREFIX = re.compile(r'^(答案[是为：:]*|正确答案[是为：:]*|选择[：:]*)')
+# markdown格式符号
+_RE_MD = re.compile(r'[*`_]')
+# 行首的选项标识（如 "A. "、"B、"）
+_RE_OPT_TAG = re.compile(r'^[A-Z][.、)]\s*')
+# 中文标点和空白（去标点匹配时使用）
+_RE_PUNCT = re.compile(r'[。，、；：！？\s]')
+# 多选题答案分隔符：统一替换为 # 后再用 str.split 拆分，无需正则
+_MULTI_DELIM_TRANS = str.maketrans({';': '#', '；': '#', '、': '#', '\n': '#'})
+# 图片扩展名（用于截断URL扩展名后附加的字符）
+_RE_IMG_EXT = re.compile(r'\.(jpg|jpeg|png|gif|bmp|webp)', re.IGNORECASE)
+# 文本中的图片URL：非贪婪匹配，遇到图片扩展名后立即停止
+_RE_IMG_URL = re.compile(r'(https?://[a-zA-Z0-9\-._~:/?#\[\]@!$&\'()*+,;=%]+?\.(?:jpg|jpeg|png|gif|bmp|webp))', re.IGNORECASE)
+# 图标类URL（如 icon/video.png、icons/ 等），不作为题目图片
+_RE_ICON_URL = re.compile(r'icon/|/icons/|/icon\.|(?:video|audio|play|pause)\.png', re.IGNORECASE)
+
+# 批量答题的答案行格式：答案1:xxx / 答案2：xxx
+_RE_BATCH_ANSWER = re.compile(r'^\s*答案\s*(\d+)\s*[:：]\s*(.*?)\s*$', re.MULTILINE)
+
+# rapidfuzz模糊匹配的最低分数（0-100），低于该分数视为未匹配
+_FUZZY_SCORE_CUTOFF = 70
+
+# 判断题倾向词（合并为单个正则，一次扫描代替逐词子串查找）
+_POS_WORDS = ('正确', '对', 'true', '√', '是', 'yes', '成立')
+_NEG_WORDS = ('错误', '错', 'false', '×', '否', 'no', '不成立')
+_POS_RE = re.compile('|'.join(map(re.escape, _POS_WORDS)), re.IGNORECASE)
+_NEG_RE = re.compile('|'.join(map(re.escape, _NEG_WORDS)), re.IGNORECASE)
+
 # 配置日志（必须在SecurityManager之前初始化）
 logging.basicConfig(
     level=logging.INFO,
@@ -599,17 +705,20 @@ class SecurityManager:
     Attributes:
         key_file (str): 密钥文件路径
         secret_key_hash (str): 密钥的SHA256哈希值
-        failed_attempts (defaultdict): IP到失败时间戳列表的映射
+        failed_attempts (OrderedDict): IP到失败时间戳列表的映射（按最近活动排序，LRU淘汰）
         rate_limit_attempts (int): 允许的最大连续失败次数
         rate_limit_window (int): 限流时间窗口（秒）
+        max_tracked_ips (int): 最多跟踪的IP数量，防止伪造IP导致内存无限增长
     """
     
     def __init__(self, key_file=SECRET_KEY_FILE):
         self.key_file = key_file
         self.secret_key_hash = None
-        self.failed_attempts = defaultdict(list)  # IP -> [timestamp1, timestamp2, ...]
+        self.failed_attempts = OrderedDict()  # IP -> [timestamp1, timestamp2, ...]
         self.rate_limit_attempts = RATE_LIMIT_ATTEMPTS
         self.rate_limit_window = RATE_LIMIT_WINDOW
+        self.max_tracked_ips = RATE_LIMIT_MAX_IPS
+        self._attempts_lock = threading.Lock()
         
         # 初始化密钥
         self._init_secret_key()
@@ -733,27 +842,41 @@ class SecurityManager:
         """检查IP是否被限流"""
         now = time.time()
         
-        # 清理过期的失败记录
-        self.failed_attempts[ip] = [
-            ts for ts in self.failed_attempts[ip]
-            if now - ts < self.rate_limit_window
-        ]
-        
-        # 检查是否超过限制
-        if len(self.failed_attempts[ip]) >= self.rate_limit_attempts:
-            remaining_time = int(self.rate_limit_window - (now - self.failed_attempts[ip][0]))
-            return False, f"错误次数过多，请{remaining_time}秒后重试"
+        with self._attempts_lock:
+            attempts = self.failed_attempts.get(ip)
+            if not attempts:
+                return True, ""
+            
+            # 清理过期的失败记录
+            attempts = [ts for ts in attempts if now - ts < self.rate_limit_window]
+            if not attempts:
+                del self.failed_attempts[ip]
+                return True, ""
+            self.failed_attempts[ip] = attempts
+            
+            # 检查是否超过限制
+            if len(attempts) >= self.rate_limit_attempts:
+                remaining_time = int(self.rate_limit_window - (now - attempts[0]))
+                return False, f"错误次数过多，请{remaining_time}秒后重试"
         
         return True, ""
     
     def record_failed_attempt(self, ip: str):
-        """记录失败的认证尝试"""
-        self.failed_attempts[ip].append(time.time())
+        """记录失败的认证尝试（超出跟踪上限时淘汰最久未活动的IP）"""
+        with self._attempts_lock:
+            attempts = self.failed_attempts.get(ip)
+            if attempts is None:
+                self.failed_attempts[ip] = [time.time()]
+                if len(self.failed_attempts) > self.max_tracked_ips:
+                    self.failed_attempts.popitem(last=False)
+            else:
+                attempts.append(time.time())
+                self.failed_attempts.move_to_end(ip)
     
     def clear_failed_attempts(self, ip: str):
         """清除失败记录（认证成功后调用）"""
-        if ip in self.failed_attempts:
-            del self.failed_attempts[ip]
+        with self._attempts_lock:
+            self.failed_attempts.pop(ip, None)
 
 # 全局安全管理器
 security_manager = SecurityManager()
@@ -792,7 +915,42 @@ def require_auth(f):
 
 # ==================== 安全认证系统结束 ====================
 
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    使用 orjson 序列化的 JSON Provider（安装了 orjson 时启用）
+    
+    与 Flask 默认行为保持一致：键排序、日期等类型的转换、调试模式缩进；
+    中文直接输出为UTF-8而非 \\uXXXX 转义。orjson 不支持的内容（如超过64位的整数、
+    自定义参数）回退到标准库 json。
+    """
+    
+    _OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+                if _HAS_ORJSON else 0)
+    
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        indent = kwargs.get('indent')
+        # orjson 只支持紧凑格式和两空格缩进，其他参数交给标准库处理
+        if (set(kwargs) <= {'indent', 'separators'} and indent in (None, 2)
+                and kwargs.get('separators') in (None, (',', ':'))):
+            option = self._OPTIONS | (orjson.OPT_INDENT_2 if indent else 0)
+            try:
+                return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+    
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        if not kwargs:
+            try:
+                return orjson.loads(s)
+            except orjson.JSONDecodeError:
+                pass
+        return super().loads(s, **kwargs)
+
+
 app = Flask(__name__)
+if _HAS_ORJSON:
+    app.json = OrjsonProvider(app)
 CORS(app)
 
 # 题型映射
@@ -804,6 +962,60 @@ QUESTION_TYPES = {
 }
 
 
+_shared_http_client = None
+_shared_http_client_lock = threading.Lock()
+
+
+def get_shared_http_client():
+    """
+    获取进程内共享的httpx客户端（懒加载，线程安全）
+    
+    所有OpenAI客户端（DeepSeek、豆包、自定义模型）共用同一个连接池，
+    httpx按 (scheme, host, port) 区分连接，不同提供商互不干扰，
+    但可以共享DNS缓存与TLS上下文，避免每个客户端重复建立连接。
+    
+    Returns:
+        httpx.Client: 已配置代理和超时的共享客户端
+    """
+    global _shared_http_client
+    if _shared_http_client is not None:
+        return _shared_http_client
+    
+    with _shared_http_client_lock:
+        if _shared_http_client is not None:
+            return _shared_http_client
+        
+        import httpx
+        
+        # 设置超时
+        try:
+            timeout = httpx.Timeout(TIMEOUT, connect=10.0)
+        except Exception:
+            # 兼容旧版本httpx
+            timeout = TIMEOUT
+        
+        # 创建httpx客户端（最简方式，避免版本兼容问题）
+        if HTTP_PROXY or HTTPS_PROXY:
+            # 有代理时配置代理
+            proxies = HTTPS_PROXY if HTTPS_PROXY else HTTP_PROXY
+            logger.info(f"✅ 已配置代理: {proxies}")
+            try:
+                http_client = httpx.Client(timeout=timeout, proxies=proxies)
+            except TypeError:
+                # 如果httpx版本不支持proxies参数，使用环境变量方式
+                if HTTPS_PROXY:
+                    os.environ['HTTPS_PROXY'] = HTTPS_PROXY
+                if HTTP_PROXY:
+                    os.environ['HTTP_PROXY'] = HTTP_PROXY
+                http_client = httpx.Client(timeout=timeout)
+        else:
+            # 无代理时直接创建
+            http_client = httpx.Client(timeout=timeout)
+        
+        _shared_http_client = http_client
+        return _shared_http_client
+
+
 class ModelClient:
     """
     统一的AI模型客户端（支持多模型和智能选择）
@@ -845,34 +1057,8 @@ class ModelClient:
         self.clients = {}
         self.models = {}
         
-        # 配置HTTP客户端（代理、超时等）
-        import httpx
-        
-        # 设置超时
-        try:
-            timeout = httpx.Timeout(TIMEOUT, connect=10.0)
-        except Exception:
-            # 兼容旧版本httpx
-            timeout = TIMEOUT
-        
-        # 创建httpx客户端（最简方式，避免版本兼容问题）
-        if HTTP_PROXY or HTTPS_PROXY:
-            # 有代理时配置代理
-            proxies = HTTPS_PROXY if HTTPS_PROXY else HTTP_PROXY
-            logger.info(f"✅ 已配置代理: {proxies}")
-            try:
-                http_client = httpx.Client(timeout=timeout, proxies=proxies)
-            except TypeError:
-                # 如果httpx版本不支持proxies参数，使用环境变量方式
-                import os
-                if HTTPS_PROXY:
-                    os.environ['HTTPS_PROXY'] = HTTPS_PROXY
-                if HTTP_PROXY:
-                    os.environ['HTTP_PROXY'] = HTTP_PROXY
-                http_client = httpx.Client(timeout=timeout)
-        else:
-            # 无代理时直接创建
-            http_client = httpx.Client(timeout=timeout)
+        # 所有提供商共享同一个HTTP客户端（连接池、TLS会话复用）
+        http_client = get_shared_http_client()
         
         # 根据provider初始化对应的客户端
         if self.provider == 'auto':
@@ -975,7 +1161,12 @@ class ModelClient:
         Returns:
             base64编码的data URI，格式: data:image/xxx;base64,xxxxx
             如果下载失败返回None
+        
+        客户端已预先下载并内联为data URI的图片直接使用，不再下载。
         """
+        if image_url.startswith('data:image/'):
+            return image_url
+        
         try:
             import httpx
             
@@ -1084,7 +1275,7 @@ class ModelClient:
                 if base64_data:
                     base64_images.append(base64_data)
                 else:
-                    logger.warning(f"⚠️  跳过无法下载的图片: {img_url}")
+                    logger.warning(f"⚠️  跳过无法下载的图片: {_describe_image_url(img_url)}")
             
             if not base64_images:
                 logger.warning("⚠️  所有图片下载失败，将使用纯文本模式")
@@ -1106,18 +1297,12 @@ class ModelClient:
                 # 再添加文本
                 user_content.append({"type": "text", "text": prompt})
                 
-                return [
-                    {"role": "system", "content": "你是一个专业、严谨的答题助手。你必须根据题目、图片和选项给出准确的答案，严格按照要求的格式输出，不要有任何多余的内容。"},
-                    {"role": "user", "content": user_content}
-                ]
+                return [SYSTEM_MESSAGE_MULTIMODAL, {"role": "user", "content": user_content}]
             else:
                 # 纯文本格式（DeepSeek或无图片）
                 if image_urls and selected_provider == 'deepseek':
                     logger.warning("⚠️  DeepSeek不支持图片输入，已忽略图片")
-                return [
-                    {"role": "system", "content": "你是一个专业、严谨的答题助手。你必须根据题目和选项给出准确的答案，严格按照要求的格式输出，不要有任何多余的内容。"},
-                    {"role": "user", "content": prompt}
-                ]
+                return [SYSTEM_MESSAGE_TEXT, {"role": "user", "content": prompt}]
         
         # 构建请求参数
         request_params = {
@@ -1299,50 +1484,19 @@ class ModelClient:
                     return 'none', None, None
 
 
-class PromptBuilder:
-    """
-    智能Prompt构建器：根据题型生成优化的提示词
-    
-    功能：
-        为不同题型（单选、多选、判断、填空）生成专门优化的提示词，
-        确保AI模型能够准确理解题目要求并返回正确格式的答案。
-    
-    设计原则：
-        1. 清晰的题目类型说明
-        2. 明确的回答格式要求
-        3. 具体的示例演示
-        4. 避免AI添加额外的解释
-    """
-    
-    @staticmethod
-    def build_prompt(question: str, options: List[str], q_type: str) -> str:
-        """根据题型构建prompt"""
-        
-        if q_type == "single":
-            return PromptBuilder._build_single_choice_prompt(question, options)
-        elif q_type == "multiple":
-            return PromptBuilder._build_multiple_choice_prompt(question, options)
-        elif q_type == "judgement":
-            return PromptBuilder._build_judgement_prompt(question, options)
-        elif q_type == "completion":
-            return PromptBuilder._build_completion_prompt(question)
-        else:
-            return PromptBuilder._build_default_prompt(question, options)
-    
-    @staticmethod
-    def _build_single_choice_prompt(question: str, options: List[str]) -> str:
-        """构建单选题prompt"""
-        options_text = "\n".join([f"{chr(65+i)}. {opt}" for i, opt in enumerate(options)])
-        
-        return f"""你是一个专业的在线考试答题助手，请严格按照要求回答。
+# ==================== Prompt模板 ====================
+# 指令部分为常量，每次只需一次 % 格式化填入题目和选项
+
+# 单选题
+_SINGLE_CHOICE_TPL = """你是一个专业的在线考试答题助手，请严格按照要求回答。
 
 【题目类型】单选题（只能选择一个正确答案）
 
 【题目】
-{question}
+%s
 
 【选项】
-{options_text}
+%s
 
 【回答要求】
 1. 仔细分析题目和所有选项
@@ -1356,20 +1510,16 @@ class PromptBuilder:
 
 现在请回答上述题目："""
 
-    @staticmethod
-    def _build_multiple_choice_prompt(question: str, options: List[str]) -> str:
-        """构建多选题prompt"""
-        options_text = "\n".join([f"{chr(65+i)}. {opt}" for i, opt in enumerate(options)])
-        
-        return f"""你是一个专业的在线考试答题助手，请严格按照要求回答。
+# 多选题
+_MULTIPLE_CHOICE_TPL = """你是一个专业的在线考试答题助手，请严格按照要求回答。
 
 【题目类型】多选题（可能有多个正确答案）
 
 【题目】
-{question}
+%s
 
 【选项】
-{options_text}
+%s
 
 【回答要求】
 1. 仔细分析题目，找出所有正确的选项
@@ -1384,18 +1534,16 @@ class PromptBuilder:
 
 现在请回答上述题目："""
 
-    @staticmethod
-    def _build_judgement_prompt(question: str, options: List[str]) -> str:
-        """构建判断题prompt"""
-        return f"""你是一个专业的在线考试答题助手，请严格按照要求回答。
+# 判断题
+_JUDGEMENT_TPL = """你是一个专业的在线考试答题助手，请严格按照要求回答。
 
 【题目类型】判断题（判断对错/是否）
 
 【题目】
-{question}
+%s
 
 【可选答案】
-{chr(10).join(options) if options else "正确 / 错误"}
+%s
 
 【回答要求】
 1. 仔细分析题目陈述是否正确
@@ -1408,15 +1556,13 @@ class PromptBuilder:
 
 现在请判断上述题目："""
 
-    @staticmethod
-    def _build_completion_prompt(question: str) -> str:
-        """构建填空题prompt"""
-        return f"""你是一个专业的在线考试答题助手，请严格按照要求回答。
+# 填空题
+_COMPLETION_TPL = """你是一个专业的在线考试答题助手，请严格按照要求回答。
 
 【题目类型】填空题
 
 【题目】
-{question}
+%s
 
 【回答要求】
 1. 仔细理解题目要求
@@ -1431,18 +1577,14 @@ class PromptBuilder:
 
 现在请回答上述填空题："""
 
-    @staticmethod
-    def _build_default_prompt(question: str, options: List[str]) -> str:
-        """构建默认prompt"""
-        options_text = "\n".join([f"- {opt}" for opt in options]) if options else "无固定选项"
-        
-        return f"""请回答以下问题：
+# 默认（未知题型）
+_DEFAULT_TPL = """请回答以下问题：
 
 【题目】
-{question}
+%s
 
 【选项】
-{options_text}
+%s
 
 【要求】
 1. 给出准确的答案
@@ -1452,6 +1594,125 @@ class PromptBuilder:
 请回答："""
 
 
+class PromptBuilder:
+    """
+    智能Prompt构建器：根据题型生成优化的提示词
+    
+    功能：
+        为不同题型（单选、多选、判断、填空）生成专门优化的提示词，
+        确保AI模型能够准确理解题目要求并返回正确格式的答案。
+    
+    设计原则：
+        1. 清晰的题目类型说明
+        2. 明确的回答格式要求
+        3. 具体的示例演示
+        4. 避免AI添加额外的解释
+    """
+    
+    @staticmethod
+    def build_prompt(question: str, options: List[str], q_type: str,
+                     options_text: Optional[str] = None) -> str:
+        """
+        根据题型构建prompt
+        
+        Args:
+            options_text: 调用方已拼接好的 "\n".join(options)，传入后判断题不再重复拼接
+        """
+        
+        if q_type == "single":
+            return PromptBuilder._build_single_choice_prompt(question, options)
+        elif q_type == "multiple":
+            return PromptBuilder._build_multiple_choice_prompt(question, options)
+        elif q_type == "judgement":
+            return PromptBuilder._build_judgement_prompt(question, options, options_text)
+        elif q_type == "completion":
+            return PromptBuilder._build_completion_prompt(question)
+        else:
+            return PromptBuilder._build_default_prompt(question, options)
+    
+    @staticmethod
+    def build_batch_prompt(questions: List[Tuple[str, List[str], str]]) -> str:
+        """
+        构建批量答题prompt：多道题目合并为一次调用，共享同一段指令
+        
+        Args:
+            questions: [(题目, 选项列表, 题型), ...]
+        
+        Returns:
+            str: 要求模型按"答案N:内容"逐行输出的prompt
+        """
+        blocks = []
+        for i, (question, options, q_type) in enumerate(questions, 1):
+            type_name = QUESTION_TYPE_NAMES.get(q_type, "问答题")
+            block = f"【题目{i}】（{type_name}）\n{question}"
+            if q_type in ("single", "multiple"):
+                options_text = "\n".join(f"{_OPT_LETTERS[j]}. {opt}" for j, opt in enumerate(options))
+                block += f"\n【选项】\n{options_text}"
+            elif q_type == "judgement":
+                block += f"\n【可选答案】\n{' / '.join(options) if options else '正确 / 错误'}"
+            elif q_type != "completion" and options:
+                block += "\n【选项】\n" + "\n".join([f"- {opt}" for opt in options])
+            blocks.append(block)
+        
+        questions_text = "\n\n".join(blocks)
+        
+        return f"""你是一个专业的在线考试答题助手，请严格按照要求回答。
+
+以下共有{len(questions)}道题目，请逐题作答。
+
+{questions_text}
+
+【回答要求】
+1. 每道题只输出一行，格式为：答案序号:答案内容
+2. 单选题、判断题只输出一个选项内容；多选题输出所有正确选项，用井号#分隔
+3. 填空题如果有多个空，答案之间用井号#分隔
+4. 选择题必须从给定的选项中选择，不要包含A、B、C等标识符
+5. 不要有任何解释、分析或额外文字，不要遗漏任何一道题
+
+【示例】
+答案1:北京
+答案2:北京#上海
+
+现在请按顺序回答上述{len(questions)}道题目："""
+    
+    @staticmethod
+    def _build_single_choice_prompt(question: str, options: List[str]) -> str:
+        """构建单选题prompt"""
+        options_text = "\n".join(f"{_OPT_LETTERS[i]}. {opt}" for i, opt in enumerate(options))
+        
+        return _SINGLE_CHOICE_TPL % (question, options_text)
+
+    @staticmethod
+    def _build_multiple_choice_prompt(question: str, options: List[str]) -> str:
+        """构建多选题prompt"""
+        options_text = "\n".join(f"{_OPT_LETTERS[i]}. {opt}" for i, opt in enumerate(options))
+        
+        return _MULTIPLE_CHOICE_TPL % (question, options_text)
+
+    @staticmethod
+    def _build_judgement_prompt(question: str, options: List[str],
+                                options_text: Optional[str] = None) -> str:
+        """构建判断题prompt"""
+        if not options:
+            options_text = "正确 / 错误"
+        elif options_text is None:
+            options_text = "\n".join(options)
+        
+        return _JUDGEMENT_TPL % (question, options_text)
+
+    @staticmethod
+    def _build_completion_prompt(question: str) -> str:
+        """构建填空题prompt"""
+        return _COMPLETION_TPL % (question,)
+
+    @staticmethod
+    def _build_default_prompt(question: str, options: List[str]) -> str:
+        """构建默认prompt"""
+        options_text = "\n".join([f"- {opt}" for opt in options]) if options else "无固定选项"
+        
+        return _DEFAULT_TPL % (question, options_text)
+
+
 class AnswerProcessor:
     """
     答案处理器：清洗和标准化AI返回的答案
@@ -1477,54 +1738,138 @@ class AnswerProcessor:
             return ""
         
         # 只移除行首的常见前缀（不影响答案内容）
-        text = re.sub(r'^(答案[是为：:]*|正确答案[是为：:]*|选择[：:]*)', '', text)
-        text = text.strip()
+        text = _RE_ANSWER_PREFIX.sub('', text)
         
         # 只移除markdown的格式符号（不是内容）
-        text = re.sub(r'[*`_]', '', text)
-        text = text.strip()
+        text = _RE_MD.sub('', text)
         
         # 只移除行首的选项标识（如 "A. "），但不影响答案本身
-        text = re.sub(r'^[A-Z][.、)]\s*', '', text)
-        text = text.strip()
+        # 选项标识锚定行首，只需先去掉左侧空白，最后统一strip一次
+        text = _RE_OPT_TAG.sub('', text.lstrip())
+        
+        return text.strip()
+    
+    @staticmethod
+    def _prepare_text(text: str) -> Tuple[str, str, str]:
+        """
+        预处理待匹配的文本，每个答案/选项只需计算一次
+        
+        Returns:
+            (去除首尾空白的原文, 小写形式, 去除标点后的小写形式)
+        """
+        stripped = text.strip()
+        lowered = stripped.lower()
+        return stripped, lowered, _RE_PUNCT.sub('', lowered)
+    
+    @staticmethod
+    def _prepare_options(options: List[str]) -> Tuple[List[Tuple[str, str, str]], Dict[str, str]]:
+        """
+        预处理选项列表
+        
+        Returns:
+            (每个选项的 _prepare_text 结果, 小写形式 -> 选项原文 的精确匹配表)
+        """
+        options_prepped = [AnswerProcessor._prepare_text(opt) for opt in options]
+        option_exact_map = {}
+        for option, option_lower, _ in options_prepped:
+            # 小写形式重复时保留第一个选项，与逐个匹配的顺序一致
+            if option_lower and option_lower not in option_exact_map:
+                option_exact_map[option_lower] = option
+        return options_prepped, option_exact_map
+    
+    @staticmethod
+    def _find_option(answer_prepped: Tuple[str, str, str],
+                     options_prepped: List[Tuple[str, str, str]],
+                     option_exact_map: Dict[str, str],
+                     fuzzy: bool = False,
+                     narrowed: bool = False) -> Optional[str]:
+        """
+        为答案查找匹配的选项，返回选项原文（去除首尾空白），匹配不到返回None
         
-        return text
+        模型通常原样输出选项内容，先查精确匹配表，未命中再逐个模糊匹配；
+        fuzzy=True 且安装了rapidfuzz时，先用 extractOne 选出最相似的选项。
+        narrowed=True 表示该答案是已与全部选项比较过的答案的子串（清洗只删掉了部分字符），
+        "选项包含于答案"不可能新出现，跳过这一检查
+        """
+        hit = option_exact_map.get(answer_prepped[1])
+        if hit is not None:
+            return hit
+        if fuzzy and _HAS_RAPIDFUZZ and answer_prepped[1]:
+            match = rf_process.extractOne(
+                answer_prepped[1],
+                [option_prepped[1] for option_prepped in options_prepped],
+                scorer=rf_fuzz.WRatio,
+                score_cutoff=_FUZZY_SCORE_CUTOFF
+            )
+            if match:
+                return options_prepped[match[2]][0]
+        for option_prepped in options_prepped:
+            if AnswerProcessor._match_option(*answer_prepped, *option_prepped,
+                                             check_option_in_answer=not narrowed):
+                return option_prepped[0]
+        return None
     
     @staticmethod
-    def _match_option(answer: str, option: str) -> bool:
+    def _match_option(answer: str, answer_lower: str, answer_nopunct: str,
+                      option: str, option_lower: str, option_nopunct: str,
+                      check_option_in_answer: bool = True) -> bool:
         """
         智能匹配答案和选项
         优先精确匹配，再模糊匹配
-        """
-        answer = answer.strip()
-        option = option.strip()
         
+        参数为 _prepare_text 的预处理结果，避免在选项循环中重复计算小写和去标点
+        """
         if not answer or not option:
             return False
         
         # 精确匹配（忽略大小写和空格）
-        if answer.lower() == option.lower():
+        if answer_lower == option_lower:
             return True
         
-        # 包含匹配
-        if answer.lower() in option.lower() or option.lower() in answer.lower():
-            return True
+        # 包含匹配：只有较短的一方可能被较长的一方包含，
+        # 长度相等时包含即相等，上面已经判断过，无需再做子串查找
+        answer_len = len(answer_lower)
+        option_len = len(option_lower)
+        if answer_len < option_len:
+            if answer_lower in option_lower:
+                return True
+        elif answer_len > option_len and check_option_in_answer:
+            if option_lower in answer_lower:
+                return True
         
         # 去除标点符号后匹配
-        answer_clean = re.sub(r'[。，、；：！？\s]', '', answer)
-        option_clean = re.sub(r'[。，、；：！？\s]', '', option)
-        if answer_clean.lower() == option_clean.lower():
-            return True
-        
-        return False
+        return answer_nopunct == option_nopunct
     
     @staticmethod
-    def process_answer(raw_answer: str, q_type: str, options: List[str]) -> str:
+    def split_batch_answers(raw_answer: str, count: int) -> List[str]:
         """
-        处理和清洗答案 - 保守策略，优先保留原始答案
+        拆分批量答题的模型输出
+        
+        Args:
+            raw_answer: 模型返回的多行文本（格式：答案N:内容）
+            count: 题目数量
+        
+        Returns:
+            List[str]: 长度为count的答案列表，缺失的题目为空字符串
         """
+        answers = [''] * count
         if not raw_answer:
-            return ""
+            return answers
+        
+        for match in _RE_BATCH_ANSWER.finditer(raw_answer):
+            index = int(match.group(1)) - 1
+            if 0 <= index < count and not answers[index]:
+                answers[index] = match.group(2)
+        
+        return answers
+    
+    @staticmethod
+    def process_answer(raw_answer: str, q_type: str, options: List[str]) -> str:
+        """
+        处理和清洗答案 - 保守策略，优先保留原始答案
+        """
+        if not raw_answer:
+            return ""
         
         raw_answer = raw_answer.strip()
         
@@ -1551,17 +1896,25 @@ class AnswerProcessor:
             # 没有选项，只做轻度清洗
             return AnswerProcessor._clean_answer(raw_answer)
         
+        # 选项只预处理一次
+        options_prepped, option_exact_map = AnswerProcessor._prepare_options(options)
+        
         # 第一步：尝试用原始答案直接匹配
-        for option in options:
-            if AnswerProcessor._match_option(raw_answer, option):
-                return option.strip()
+        raw_prepped = AnswerProcessor._prepare_text(raw_answer)
+        matched = AnswerProcessor._find_option(raw_prepped, options_prepped, option_exact_map, fuzzy=True)
+        if matched is not None:
+            return matched
         
         # 第二步：轻度清洗后再匹配
         cleaned = AnswerProcessor._clean_answer(raw_answer)
         if cleaned != raw_answer:  # 如果清洗有变化
-            for option in options:
-                if AnswerProcessor._match_option(cleaned, option):
-                    return option.strip()
+            # 清洗通常只去掉前缀等少量字符，此时无需重复第一步已做过的包含检查
+            cleaned_prepped = AnswerProcessor._prepare_text(cleaned)
+            matched = AnswerProcessor._find_option(
+                cleaned_prepped, options_prepped, option_exact_map, fuzzy=True,
+                narrowed=cleaned_prepped[1] in raw_prepped[1])
+            if matched is not None:
+                return matched
         
         # 第三步：如果还是匹配不到，返回清洗后的答案
         # 这样至少保留了可能的正确答案，而不是空字符串
@@ -1574,35 +1927,39 @@ class AnswerProcessor:
             return AnswerProcessor._clean_answer(raw_answer)
         
         # 分割答案（支持多种分隔符）
-        raw_answers = re.split(r'[#;；、\n]', raw_answer)
+        raw_answers = raw_answer.translate(_MULTI_DELIM_TRANS).split('#')
+        # 只strip一次并去掉空片段，两轮匹配共用
+        raw_stripped = tuple(ans for ans in (x.strip() for x in raw_answers) if ans)
         matched_options = []
         
+        # 选项只预处理一次
+        options_prepped, option_exact_map = AnswerProcessor._prepare_options(options)
+        
         # 第一步：用原始答案匹配
-        for raw_ans in raw_answers:
-            raw_ans = raw_ans.strip()
-            if not raw_ans:
-                continue
-            
-            for option in options:
-                if AnswerProcessor._match_option(raw_ans, option):
-                    option_clean = option.strip()
-                    if option_clean not in matched_options:
-                        matched_options.append(option_clean)
-                    break
+        for raw_ans in raw_stripped:
+            answer_prepped = AnswerProcessor._prepare_text(raw_ans)
+            option_clean = AnswerProcessor._find_option(
+                answer_prepped, options_prepped, option_exact_map, fuzzy=True)
+            if option_clean is not None and option_clean not in matched_options:
+                matched_options.append(option_clean)
         
         # 第二步：如果匹配到了，直接返回
         if matched_options:
             return "#".join(matched_options)
         
         # 第三步：尝试清洗后再匹配
-        cleaned_answers = [AnswerProcessor._clean_answer(ans) for ans in raw_answers if ans.strip()]
-        for cleaned_ans in cleaned_answers:
-            for option in options:
-                if AnswerProcessor._match_option(cleaned_ans, option):
-                    option_clean = option.strip()
-                    if option_clean not in matched_options:
-                        matched_options.append(option_clean)
-                    break
+        for raw_ans in raw_stripped:
+            cleaned_ans = AnswerProcessor._clean_answer(raw_ans)
+            if not cleaned_ans or cleaned_ans == raw_ans:
+                # 清洗后为空或无变化（第一步已匹配过），跳过
+                continue
+            
+            answer_prepped = AnswerProcessor._prepare_text(cleaned_ans)
+            option_clean = AnswerProcessor._find_option(
+                answer_prepped, options_prepped, option_exact_map, fuzzy=True,
+                narrowed=answer_prepped[1] in raw_ans.lower())
+            if option_clean is not None and option_clean not in matched_options:
+                matched_options.append(option_clean)
         
         # 第四步：返回匹配结果或清洗后的原始答案
         if matched_options:
@@ -1612,56 +1969,71 @@ class AnswerProcessor:
             cleaned = AnswerProcessor._clean_answer(raw_answer)
             return cleaned if cleaned else raw_answer
     
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def _judgement_option_polarity(options: Tuple[str, ...]) -> Tuple[int, int]:
+        """
+        标记判断题选项的倾向，返回 (第一个正向选项下标, 第一个负向选项下标)，没有则为 -1
+        
+        判断题的选项几乎总是同一组（如 "正确"/"错误"），按选项元组缓存结果
+        """
+        pos_idx = neg_idx = -1
+        for i, opt in enumerate(options):
+            if pos_idx < 0 and _POS_RE.search(opt):
+                pos_idx = i
+            if neg_idx < 0 and _NEG_RE.search(opt):
+                neg_idx = i
+        return pos_idx, neg_idx
+    
     @staticmethod
     def _process_judgement(raw_answer: str, options: List[str]) -> str:
         """处理判断题答案 - 保守策略"""
         if not options:
             return AnswerProcessor._clean_answer(raw_answer)
         
-        raw_answer_lower = raw_answer.lower()
+        # 选项只预处理一次
+        options_prepped, option_exact_map = AnswerProcessor._prepare_options(options)
         
         # 第一步：直接匹配选项
-        for option in options:
-            if AnswerProcessor._match_option(raw_answer, option):
-                return option.strip()
+        raw_prepped = AnswerProcessor._prepare_text(raw_answer)
+        matched = AnswerProcessor._find_option(raw_prepped, options_prepped, option_exact_map)
+        if matched is not None:
+            return matched
         
         # 第二步：清洗后匹配
         cleaned = AnswerProcessor._clean_answer(raw_answer)
         if cleaned != raw_answer:
-            for option in options:
-                if AnswerProcessor._match_option(cleaned, option):
-                    return option.strip()
+            # 清洗通常只去掉前缀等少量字符，此时无需重复第一步已做过的包含检查
+            cleaned_prepped = AnswerProcessor._prepare_text(cleaned)
+            matched = AnswerProcessor._find_option(
+                cleaned_prepped, options_prepped, option_exact_map,
+                narrowed=cleaned_prepped[1] in raw_prepped[1])
+            if matched is not None:
+                return matched
         
         # 第三步：语义匹配（保守）
         # 只在不匹配的情况下才进行语义判断
-        cleaned_lower = cleaned.lower()
-        
         # 判断"正确"倾向
-        positive_words = ['正确', '对', 'true', '√', '是', 'yes', '成立']
-        negative_words = ['错误', '错', 'false', '×', '否', 'no', '不成立']
+        has_positive = _POS_RE.search(cleaned) is not None
+        has_negative = _NEG_RE.search(cleaned) is not None
         
-        has_positive = any(word in cleaned_lower for word in positive_words)
-        has_negative = any(word in cleaned_lower for word in negative_words)
+        if has_positive == has_negative:
+            # 无法判断，返回清洗后的原始答案
+            return cleaned if cleaned else raw_answer
+        
+        pos_idx, neg_idx = AnswerProcessor._judgement_option_polarity(tuple(options))
         
         # 只在明确有倾向且没有匹配到选项时才使用
-        if has_positive and not has_negative:
-            for opt in options:
-                opt_lower = opt.lower()
-                if any(word in opt_lower for word in positive_words):
-                    return opt.strip()
+        if has_positive:
+            if pos_idx >= 0:
+                return options[pos_idx].strip()
             # 如果选项中没有明确的正向词，返回第一个选项（通常判断题第一个是"正确"）
             return options[0].strip() if len(options) > 0 else cleaned
         
-        if has_negative and not has_positive:
-            for opt in options:
-                opt_lower = opt.lower()
-                if any(word in opt_lower for word in negative_words):
-                    return opt.strip()
-            # 如果选项中没有明确的负向词，返回第二个选项（通常判断题第二个是"错误"）
-            return options[1].strip() if len(options) > 1 else cleaned
-        
-        # 无法判断，返回清洗后的原始答案
-        return cleaned if cleaned else raw_answer
+        if neg_idx >= 0:
+            return options[neg_idx].strip()
+        # 如果选项中没有明确的负向词，返回第二个选项（通常判断题第二个是"错误"）
+        return options[1].strip() if len(options) > 1 else cleaned
 
 
 # 创建全局模型客户端
@@ -1744,32 +2116,22 @@ def _call_custom_model(model_id: str, prompt: str, image_urls: List[str] = None,
     Returns:
         (推理过程, 最终答案, token使用量)
     """
-    import httpx
-    from openai import OpenAI
-    
     model = custom_model_manager.get_model(model_id)
     if not model:
         logger.error(f"自定义模型不存在: {model_id}")
         return None, None, None
     
     try:
-        # 创建客户端
-        http_client_kwargs = {'timeout': TIMEOUT}
-        if HTTPS_PROXY:
-            http_client_kwargs['proxies'] = HTTPS_PROXY
-        
-        http_client = httpx.Client(**http_client_kwargs)
+        # 创建客户端（复用共享的HTTP连接池）
         client = OpenAI(
             api_key=model['api_key'],
             base_url=model['base_url'],
-            http_client=http_client,
+            http_client=get_shared_http_client(),
             max_retries=MAX_RETRIES
         )
         
         # 构建消息
-        messages = [
-            {"role": "system", "content": "你是一个专业、严谨的答题助手。你必须根据题目和选项给出准确的答案，严格按照要求的格式输出，不要有任何多余的内容。"}
-        ]
+        messages = [SYSTEM_MESSAGE_TEXT]
         
         # 处理图片（如果模型支持多模态）
         if image_urls and model.get('is_multimodal', False):
@@ -1834,6 +2196,116 @@ def _call_custom_model(model_id: str, prompt: str, image_urls: List[str] = None,
         return None, None, None
 
 
+def _answer_with_failover(q_type: Optional[str], prompt: str, image_urls: List[str] = None,
+                          force_reasoning: bool = False) -> Tuple[Optional[str], Optional[str], Optional[Dict[str, int]], Optional[str], Optional[str], Optional[str]]:
+    """
+    按优先级调用模型获取答案：先尝试题型配置的自定义模型（故障转移），全部失败后使用默认模型客户端
+    
+    Args:
+        q_type: 题型（用于查找题型对应的自定义模型），None表示直接使用默认模型客户端
+        prompt: 提示词
+        image_urls: 图片URL列表
+        force_reasoning: 是否强制启用思考模式
+    
+    Returns:
+        (推理过程, 原始答案, token使用量, 自定义模型ID, 实际提供商, 模型名称)
+    """
+    # 获取该题型的所有可用模型（按优先级排序），q_type为None时跳过自定义模型
+    type_models = custom_model_manager.get_question_type_models(q_type) if q_type else []
+    
+    reasoning = None
+    raw_answer = None
+    usage_info = None
+    custom_model_id = None
+    actual_provider = None
+    model_name = None
+    
+    if type_models:
+        # 尝试使用自定义模型（支持故障转移）
+        for model_id in type_models:
+            model = custom_model_manager.get_model(model_id)
+            if not model or not model.get('enabled', True):
+                continue
+            
+            # 如果有图片，必须是多模态模型
+            if image_urls and not model.get('is_multimodal', False):
+                logger.info(f"⏭️  跳过非多模态模型: {model_id}")
+                continue
+            
+            # 尝试调用模型
+            logger.info(f"🎯 使用自定义模型: {model_id}")
+            print(f"🎯 使用自定义模型: {model_id}")
+            
+            reasoning, raw_answer, usage_info = _call_custom_model(
+                model_id,
+                prompt,
+                image_urls,
+                force_reasoning
+            )
+            
+            if raw_answer:
+                # 成功获取答案
+                custom_model_id = model_id
+                actual_provider = 'custom'
+                model_name = model.get('name', model_id)
+                break
+            else:
+                # 失败，尝试下一个模型
+                logger.warning(f"⚠️  模型 {model_id} 调用失败，尝试下一个模型...")
+                print(f"⚠️  模型 {model_id} 调用失败，尝试下一个模型...")
+    
+    # 如果自定义模型都失败了，使用默认的 model_client
+    if not raw_answer and model_client:
+        # 使用默认的 model_client
+        reasoning, raw_answer, usage_info = model_client.chat(
+            prompt, 
+            force_reasoning=force_reasoning,
+            image_urls=image_urls if image_urls else None
+        )
+        # 确定实际使用的模型名称和提供商
+        if model_client.is_auto_mode:
+            actual_provider = model_client._select_model(image_urls if image_urls else None)[0]
+            if actual_provider in model_client.models:
+                model_name = model_client.models[actual_provider]
+            else:
+                model_name = "auto-unknown"
+        else:
+            model_name = model_client.model if not force_reasoning else ('deepseek-reasoner' if model_client.provider == 'deepseek' else model_client.model)
+            actual_provider = model_client.provider
+    
+    return reasoning, raw_answer, usage_info, custom_model_id, actual_provider, model_name
+
+
+def _normalize_options(options: Any) -> List[str]:
+    """
+    将请求中的选项统一为字符串列表
+    
+    支持：
+        - 字符串：按换行符分割（OCS脚本传递的格式）
+        - 列表：清理每个选项
+        - 其他格式：返回空列表
+    """
+    if isinstance(options, str):
+        return [opt.strip() for opt in options.split('\n') if opt.strip()]
+    if isinstance(options, list):
+        return [str(opt).strip() for opt in options if opt]
+    return []
+
+
+def _describe_image_url(url: str) -> str:
+    """
+    图片的控制台显示文本
+    
+    客户端内联的 data URI 可能有数MB，只显示MIME类型和解码后的大致大小，普通URL原样返回。
+    """
+    if not url.startswith('data:'):
+        return url
+    header, _, payload = url.partition(',')
+    mime = header[5:].split(';', 1)[0] or 'unknown'
+    size_kb = len(payload) * 3 / 4 / 1024
+    return f"[内联图片 {mime}, 约{size_kb:.1f}KB]"
+
+
 def check_and_fix_csv_header(csv_file: str, correct_headers: List[str]) -> bool:
     """
     检查并自动修复CSV文件的表头格式
@@ -1861,6 +2333,15 @@ def check_and_fix_csv_header(csv_file: str, correct_headers: List[str]) -> bool:
     try:
         # 读取当前表头
         with open(csv_file, 'r', encoding='utf-8-sig') as f:
+            # 快速路径：只读第一行做字符串比较，表头正确时无需解析整个文件
+            first_line = f.readline()
+            if not first_line:
+                # 空文件，无需修复
+                return True
+            if first_line.rstrip('\r\n') == ','.join(correct_headers):
+                return True
+            
+            f.seek(0)
             reader = csv.reader(f)
             current_headers = next(reader, None)
             if current_headers is None:
@@ -1914,6 +2395,74 @@ def check_and_fix_csv_header(csv_file: str, correct_headers: List[str]) -> bool:
         return False
 
 
+# CSV日志持久句柄：进程内只打开一次，避免每条记录都重新打开文件和检查表头
+_csv_lock = threading.Lock()
+_csv_file = None
+_csv_path = None
+
+
+def _csv_escape(value: Optional[str]) -> str:
+    """按CSV最小引用规则转义单个字段（与 csv.QUOTE_MINIMAL 输出一致）"""
+    if value is None:
+        return ''
+    if '"' in value or ',' in value or '\n' in value or '\r' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+
+def _csv_line(fields: List[str]) -> str:
+    """拼接一行CSV文本，行尾与 csv.writer 默认的 \\r\\n 保持一致"""
+    return ','.join([_csv_escape(field) for field in fields]) + '\r\n'
+
+
+def _close_csv_file():
+    """关闭持久打开的CSV文件（调用方需持有 _csv_lock，进程退出时自动调用）"""
+    global _csv_file, _csv_path
+    if _csv_file is not None:
+        try:
+            _csv_file.close()
+        except Exception as e:
+            logger.warning(f"关闭CSV文件失败: {str(e)}")
+    _csv_file = None
+    _csv_path = None
+
+
+atexit.register(_close_csv_file)
+
+
+def _ensure_csv_open(csv_file: str):
+    """
+    获取CSV日志的文件句柄（调用方需持有 _csv_lock）
+    
+    首次调用时检查并修复表头，然后以追加模式打开文件并保持打开；
+    文件路径变化或文件被外部删除时重新打开。
+    
+    Returns:
+        持久打开的文本文件对象
+    """
+    global _csv_file, _csv_path
+    
+    if _csv_file is not None and _csv_path == csv_file and os.path.exists(csv_file):
+        return _csv_file
+    
+    _close_csv_file()
+    
+    # 检查并修复CSV文件表头（如果需要），每次打开只检查一次
+    file_exists = os.path.exists(csv_file) and os.path.getsize(csv_file) > 0
+    if file_exists:
+        check_and_fix_csv_header(csv_file, CSV_HEADERS)
+    
+    # 使用UTF-8 BOM编码，确保Excel可以正确显示中文（追加时不会重复写入BOM）
+    _csv_file = open(csv_file, 'a', newline='', encoding='utf-8-sig', buffering=1 << 16)
+    _csv_path = csv_file
+    
+    # 新文件写入表头
+    if not file_exists:
+        _csv_file.write(_csv_line(CSV_HEADERS))
+    
+    return _csv_file
+
+
 def save_to_csv(question: str, options: List[str], q_type: str, raw_answer: str, 
                 reasoning: Optional[str], processed_answer: str, ai_time: float, 
                 total_time: float, model_name: str, reasoning_used: bool,
@@ -1938,83 +2487,50 @@ def save_to_csv(question: str, options: List[str], q_type: str, raw_answer: str,
     """
     csv_file = os.getenv('CSV_LOG_FILE', 'ocs_answers_log.csv')
     
-    # CSV表头
-    headers = [
-        '时间戳', '题型', '题目', '选项', '原始回答', '思考过程', 
-        '处理后答案', 'AI耗时(秒)', '总耗时(秒)', '模型', '思考模式',
-        '输入Token', '输出Token', '总Token', '费用(元)', '提供商'
-    ]
-    
-    # 检查并修复CSV文件表头（如果需要）
-    if os.path.exists(csv_file):
-        check_and_fix_csv_header(csv_file, headers)
-    
-    # 检查文件是否存在，如果不存在则创建并写入表头
-    file_exists = os.path.exists(csv_file)
-    
     try:
-        # 使用UTF-8 BOM编码，确保Excel可以正确显示中文
-        with open(csv_file, 'a', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f, quoting=csv.QUOTE_MINIMAL)
-            
-            # 如果文件不存在，写入表头
-            if not file_exists:
-                writer.writerow(headers)
-            
-            # 准备数据
-            timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            options_str = ' | '.join(options) if options else ''
-            reasoning_str = reasoning if reasoning else ''
-            
-            # 计算费用（基于DeepSeek和豆包的官方价格）
-            # DeepSeek: 输入缓存命中0.2元/百万tokens，缓存未命中2元/百万tokens，输出3元/百万tokens
-            # 豆包-Seed-1.6: 推理输入0.8元/百万tokens，推理输出2元/百万tokens
-            # 注意：这里假设缓存未命中（实际应该根据缓存状态判断）
-            cost = 0.0
-            if provider.lower() == 'deepseek':
-                # DeepSeek价格（假设缓存未命中）
-                input_cost = (prompt_tokens / 1000000) * 2.0  # 2元/百万tokens
-                output_cost = (completion_tokens / 1000000) * 3.0  # 3元/百万tokens
-                cost = input_cost + output_cost
-            elif provider.lower() == 'doubao':
-                # 豆包-Seed-1.6 官方价格
-                input_cost = (prompt_tokens / 1000000) * 0.8  # 0.8元/百万tokens
-                output_cost = (completion_tokens / 1000000) * 2.0  # 2元/百万tokens
-                cost = input_cost + output_cost
-            else:
-                # 未知提供商，使用默认价格（参考DeepSeek）
-                input_cost = (prompt_tokens / 1000000) * 2.0
-                output_cost = (completion_tokens / 1000000) * 3.0
-                cost = input_cost + output_cost
-            
-            total_tokens = prompt_tokens + completion_tokens
-            
-            # 写入数据行（所有字段都会被正确转义）
-            row = [
-                timestamp,
-                q_type,
-                question,
-                options_str,
-                raw_answer,
-                reasoning_str,
-                processed_answer,
-                f"{ai_time:.2f}",
-                f"{total_time:.2f}",
-                model_name,
-                '是' if reasoning_used else '否',
-                str(prompt_tokens),
-                str(completion_tokens),
-                str(total_tokens),
-                f"{cost:.6f}",
-                provider.upper() if provider else ''
-            ]
-            
-            writer.writerow(row)
-            logger.debug(f"CSV记录已保存: {len(row)}个字段，思考过程长度: {len(reasoning_str)}")
-            
+        # 准备数据
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        options_str = ' | '.join(options) if options else ''
+        reasoning_str = reasoning if reasoning else ''
+        
+        # 计算费用（基于DeepSeek和豆包的官方价格，见 _PROVIDER_RATES）
+        # 注意：这里假设缓存未命中（实际应该根据缓存状态判断）
+        in_rate, out_rate = _PROVIDER_RATES.get(provider.lower(), _DEFAULT_RATES)
+        cost = prompt_tokens * in_rate + completion_tokens * out_rate
+        
+        total_tokens = prompt_tokens + completion_tokens
+        
+        # 写入数据行（所有字段都会被正确转义，直接拼接比 csv.writer 更快）
+        row = [
+            timestamp,
+            q_type,
+            question,
+            options_str,
+            raw_answer,
+            reasoning_str,
+            processed_answer,
+            f"{ai_time:.2f}",
+            f"{total_time:.2f}",
+            model_name,
+            '是' if reasoning_used else '否',
+            str(prompt_tokens),
+            str(completion_tokens),
+            str(total_tokens),
+            f"{cost:.6f}",
+            provider.upper() if provider else ''
+        ]
+        
+        line = _csv_line(row)
+        with _csv_lock:
+            f = _ensure_csv_open(csv_file)
+            f.write(line)
+            # 每条记录立即刷新，保证数据查看接口能读到最新记录
+            f.flush()
+        logger.debug("CSV记录已保存: %d个字段，思考过程长度: %d", len(row), len(reasoning_str))
+        
     except Exception as e:
         # CSV记录失败不影响答题流程，只记录日志
-        logger.warning(f"保存CSV记录失败: {str(e)}", exc_info=True)
+        logger.warning("保存CSV记录失败: %s", e)
 
 
 @app.route('/api/answer', methods=['POST'])
@@ -2086,84 +2602,73 @@ def answer_question():
             return jsonify({"success": False, "error": "题目不能为空"}), 400
         
         q_type = QUESTION_TYPES.get(type_num, "single")
-        q_type_name = {"single": "单选题", "multiple": "多选题", "judgement": "判断题", "completion": "填空题"}.get(q_type, "未知题型")
+        q_type_name = QUESTION_TYPE_NAMES.get(q_type, "未知题型")
         
         # 处理选项：支持多种格式
-        if isinstance(options, str):
-            # 如果是字符串，按换行符分割（OCS脚本传递的格式）
-            options = [opt.strip() for opt in options.split('\n') if opt.strip()]
-        elif isinstance(options, list):
-            # 如果是列表，清理每个选项
-            options = [str(opt).strip() for opt in options if opt]
-        else:
-            # 其他格式转为空列表
-            options = []
+        options = _normalize_options(options)
         
-        # 提取题目中的图片URL
-        image_urls = []
+        # 提取图片URL：API传入的图片 + 题干和选项中的图片URL
+        # 使用dict作为有序集合去重，并在收集时直接过滤图标URL
+        collected_urls = {}
         
         # 清理URL的函数（去除扩展名后可能附加的字符）
         def clean_url(url):
             """清理URL，去除扩展名后可能附加的字符"""
             url = str(url).strip()
             # 找到最后一个图片扩展名的位置
-            match = re.search(r'\.(jpg|jpeg|png|gif|bmp|webp)', url, re.IGNORECASE)
+            match = _RE_IMG_EXT.search(url)
             if match:
                 # 只保留到扩展名结束（包括扩展名）
                 end_pos = match.end()
                 return url[:end_pos]
             return url
         
-        if images and isinstance(images, list):
-            image_urls = [clean_url(img) for img in images if img]
+        def collect_url(url):
+            """收集图片URL，跳过明显的图标URL（通常不是题目内容）"""
+            if _RE_ICON_URL.search(url):
+                logger.debug("跳过图标URL: %s", url)
+                return
+            collected_urls[url] = None
         
-        # 从题目文本中提取图片URL（支持常见图片格式）
-        # 使用非贪婪匹配，确保在遇到图片扩展名后立即停止
-        # 匹配URL中的合法字符，但使用非贪婪模式避免匹配过多
-        img_pattern = r'(https?://[a-zA-Z0-9\-._~:/?#\[\]@!$&\'()*+,;=%]+?\.(?:jpg|jpeg|png|gif|bmp|webp))'
-        found_images = re.findall(img_pattern, question, re.IGNORECASE)
+        api_image_count = 0
+        if images and isinstance(images, list):
+            for img in images:
+                if img:
+                    api_image_count += 1
+                    img = str(img).strip()
+                    if img.startswith('data:image/'):
+                        # 客户端已内联的图片：不是URL，不做扩展名截断和图标过滤
+                        collected_urls[img] = None
+                    else:
+                        collect_url(clean_url(img))
+        
+        # 选项只拼接一次，图片扫描和判断题prompt共用
+        options_joined = '\n'.join(options) if options else ''
+        
+        # 题干和选项合并后只扫描一次，按匹配位置区分图片来源
+        # URL字符集不含空白，匹配不会跨越题干与选项的分界
+        scan_text = question + '\n' + options_joined if options else question
+        question_len = len(question)
+        question_image_count = 0
+        option_image_count = 0
+        for match in _RE_IMG_URL.finditer(scan_text):
+            if match.start() < question_len:
+                question_image_count += 1
+            else:
+                option_image_count += 1
+            collect_url(clean_url(match.group(1)))
         
-        # 清理提取的URL
-        found_images = [clean_url(url) for url in found_images]
+        if question_image_count:
+            logger.info(f"📷 从题目中检测到 {question_image_count} 张图片")
+        if option_image_count:
+            logger.info(f"📷 从选项中检测到 {option_image_count} 张图片")
         
-        if found_images:
-            logger.info(f"📷 从题目中检测到 {len(found_images)} 张图片")
-        image_urls.extend(found_images)
-        
-        # 从选项中提取图片URL
-        found_images_in_options = []
-        if options:
-            options_text = ' '.join(str(opt) for opt in options)
-            found_images_in_options = re.findall(img_pattern, options_text, re.IGNORECASE)
-            found_images_in_options = [clean_url(url) for url in found_images_in_options]
-            if found_images_in_options:
-                logger.info(f"📷 从选项中检测到 {len(found_images_in_options)} 张图片")
-                image_urls.extend(found_images_in_options)
-        
-        image_urls = list(dict.fromkeys(image_urls))  # 去重
-        
-        # 过滤掉明显的图标URL（通常不是题目内容）
-        # 例如：icon/video.png, icon/audio.png, icons/ 等
-        filtered_image_urls = []
-        icon_keywords = ['/icon/', '/icons/', '/icon.', 'icon/', 'video.png', 'audio.png', 'play.png', 'pause.png']
-        
-        for img_url in image_urls:
-            # 跳过明显的图标URL
-            img_url_lower = img_url.lower()
-            is_icon = any(keyword in img_url_lower for keyword in icon_keywords)
-            
-            if is_icon:
-                logger.debug(f"跳过图标URL: {img_url}")
-                continue
-            
-            filtered_image_urls.append(img_url)
-        
-        image_urls = filtered_image_urls
+        image_urls = list(collected_urls)
         
         # 记录图片检测结果
-        total_found = len(found_images) + len(found_images_in_options) + len([img for img in (images or []) if img])
+        total_found = question_image_count + option_image_count + api_image_count
         if total_found > 0:
-            logger.info(f"📷 图片检测结果: 题干{len(found_images)}张, 选项{len(found_images_in_options)}张, API传入{len(images or [])}张, 过滤后{len(image_urls)}张")
+            logger.info(f"📷 图片检测结果: 题干{question_image_count}张, 选项{option_image_count}张, API传入{api_image_count}张, 过滤后{len(image_urls)}张")
         
         # 如果过滤后没有图片，记录日志
         if len(image_urls) == 0 and total_found > 0:
@@ -2177,14 +2682,14 @@ def answer_question():
             print(f"选项: {' | '.join(options)}")
         if image_urls:
             print(f"📷 检测到图片: {len(image_urls)}张")
-            if found_images_in_options and len(found_images_in_options) > 0:
+            if option_image_count:
                 print(f"   ⚠️  选项中有图片，将自动使用豆包模型")
             for i, img_url in enumerate(image_urls, 1):
-                print(f"   {i}. {img_url}")
+                print(f"   {i}. {_describe_image_url(img_url)}")
         print("="*80)
         
         # 构建prompt
-        prompt = PromptBuilder.build_prompt(question, options, q_type)
+        prompt = PromptBuilder.build_prompt(question, options, q_type, options_text=options_joined)
         
         # 确定是否启用思考模式
         force_reasoning = False
@@ -2215,68 +2720,12 @@ def answer_question():
         # 优先使用自定义模型，支持故障转移
         ai_start = time.time()
         
-        # 获取该题型的所有可用模型（按优先级排序）
-        type_models = custom_model_manager.get_question_type_models(q_type)
-        
-        reasoning = None
-        raw_answer = None
-        usage_info = None
-        custom_model_id = None
-        actual_provider = None
-        model_name = None
-        
-        if type_models:
-            # 尝试使用自定义模型（支持故障转移）
-            for model_id in type_models:
-                model = custom_model_manager.get_model(model_id)
-                if not model or not model.get('enabled', True):
-                    continue
-                
-                # 如果有图片，必须是多模态模型
-                if image_urls and not model.get('is_multimodal', False):
-                    logger.info(f"⏭️  跳过非多模态模型: {model_id}")
-                    continue
-                
-                # 尝试调用模型
-                logger.info(f"🎯 使用自定义模型: {model_id}")
-                print(f"🎯 使用自定义模型: {model_id}")
-                
-                reasoning, raw_answer, usage_info = _call_custom_model(
-                    model_id,
-                    prompt,
-                    image_urls,
-                    force_reasoning
-                )
-                
-                if raw_answer:
-                    # 成功获取答案
-                    custom_model_id = model_id
-                    actual_provider = 'custom'
-                    model_name = model.get('name', model_id)
-                    break
-                else:
-                    # 失败，尝试下一个模型
-                    logger.warning(f"⚠️  模型 {model_id} 调用失败，尝试下一个模型...")
-                    print(f"⚠️  模型 {model_id} 调用失败，尝试下一个模型...")
-        
-        # 如果自定义模型都失败了，使用默认的 model_client
-        if not raw_answer and model_client:
-            # 使用默认的 model_client
-            reasoning, raw_answer, usage_info = model_client.chat(
-                prompt, 
-                force_reasoning=force_reasoning,
-                image_urls=image_urls if image_urls else None
-            )
-            # 确定实际使用的模型名称和提供商
-            if model_client.is_auto_mode:
-                actual_provider = model_client._select_model(image_urls if image_urls else None)[0]
-                if actual_provider in model_client.models:
-                    model_name = model_client.models[actual_provider]
-                else:
-                    model_name = "auto-unknown"
-            else:
-                model_name = model_client.model if not force_reasoning else ('deepseek-reasoner' if model_client.provider == 'deepseek' else model_client.model)
-                actual_provider = model_client.provider
+        reasoning, raw_answer, usage_info, custom_model_id, actual_provider, model_name = _answer_with_failover(
+            q_type,
+            prompt,
+            image_urls,
+            force_reasoning
+        )
         
         ai_time = time.time() - ai_start
         
@@ -2356,11 +2805,10 @@ def answer_question():
                 "color": "green"
             })
         elif model_client.is_auto_mode:
-            # 智能模式：显示实际使用的模型
-            auto_provider = model_client._select_model(image_urls if image_urls else None)[0]
-            display_provider = auto_provider.upper()
-            if auto_provider in model_client.models:
-                display_model = model_client.models[auto_provider]
+            # 智能模式：显示实际使用的模型（复用答题时已选定的提供商）
+            display_provider = actual_provider.upper()
+            if actual_provider in model_client.models:
+                display_model = model_client.models[actual_provider]
             else:
                 display_model = "unknown"
             
@@ -2412,8 +2860,7 @@ def answer_question():
         if custom_model_id:
             response_provider = f"custom({custom_model_id})"
         elif model_client.is_auto_mode:
-            auto_prov = model_client._select_model(image_urls if image_urls else None)[0]
-            response_provider = f"auto({auto_prov})"
+            response_provider = f"auto({actual_provider})"
         else:
             response_provider = model_client.provider
         
@@ -2447,6 +2894,174 @@ def answer_question():
         return jsonify({"success": False, "error": f"服务器错误: {str(e)}"}), 500
 
 
+@app.route('/api/answer_batch', methods=['POST'])
+def answer_question_batch():
+    """
+    批量答题API接口：多道纯文本题目合并为一次模型调用
+    
+    请求格式 (JSON):
+        {
+            "batch": [
+                {"question": "题目内容", "options": [...], "type": 0},
+                ...
+            ]
+        }
+    
+    响应格式 (JSON):
+        {
+            "success": true,
+            "results": [
+                {"success": true, "question": "...", "answer": "...", "type": "single", "raw_answer": "..."},
+                ...
+            ],
+            "model": "deepseek-chat",
+            "provider": "deepseek",
+            "reasoning_used": false,
+            "ai_time": 2.34,
+            "total_time": 2.40,
+            "usage": {"prompt_tokens": 300, "completion_tokens": 30, "total_tokens": 330}
+        }
+    
+    说明：
+        - 系统提示词和答题要求只发送一次，按题目数分摊token和网络往返
+        - 仅支持纯文本题目，图片题请使用 /api/answer
+        - 单次最多 BATCH_MAX_QUESTIONS 道题目
+        - token用量按题目数平均分摊后逐题记录到CSV
+    """
+    start_time = time.time()
+    
+    try:
+        if not model_client:
+            error_msg = init_error or "模型客户端未初始化，请检查配置"
+            return jsonify({
+                "success": False,
+                "error": error_msg,
+                "hint": "请检查.env文件中的API密钥配置"
+            }), 500
+        
+        data = request.get_json()
+        batch = data.get('batch') if isinstance(data, dict) else None
+        
+        if not batch or not isinstance(batch, list):
+            return jsonify({"success": False, "error": "batch必须是非空数组"}), 400
+        
+        if len(batch) > BATCH_MAX_QUESTIONS:
+            return jsonify({"success": False, "error": f"单次最多提交 {BATCH_MAX_QUESTIONS} 道题目"}), 400
+        
+        # 解析并校验每道题目
+        items = []
+        for i, entry in enumerate(batch, 1):
+            if not isinstance(entry, dict):
+                return jsonify({"success": False, "error": f"第{i}题格式无效"}), 400
+            
+            question = str(entry.get('question', '')).strip()
+            if not question:
+                return jsonify({"success": False, "error": f"第{i}题题目不能为空"}), 400
+            
+            if entry.get('images'):
+                return jsonify({"success": False, "error": f"第{i}题包含图片，批量接口仅支持纯文本题目，请使用 /api/answer"}), 400
+            
+            q_type = QUESTION_TYPES.get(entry.get('type', 0), "single")
+            items.append((question, _normalize_options(entry.get('options', [])), q_type))
+        
+        q_types = {q_type for _, _, q_type in items}
+        
+        # 确定是否启用思考模式（任意题型需要思考则整批启用）
+        force_reasoning = any(custom_model_manager.get_question_type_reasoning(t) for t in q_types)
+        if "multiple" in q_types and model_client.auto_reasoning_for_multiple:
+            force_reasoning = True
+        
+        prompt = PromptBuilder.build_batch_prompt(items)
+        
+        print("\n" + "="*80)
+        print(f"📚 【批量答题】共 {len(items)} 道题目")
+        print("="*80)
+        
+        # 题型一致时使用题型配置的自定义模型，否则直接使用默认模型客户端
+        ai_start = time.time()
+        reasoning, raw_answer, usage_info, custom_model_id, actual_provider, model_name = _answer_with_failover(
+            next(iter(q_types)) if len(q_types) == 1 else None,
+            prompt,
+            None,
+            force_reasoning
+        )
+        ai_time = time.time() - ai_start
+        
+        if not raw_answer:
+            print(f"❌ 批量答题失败: AI未返回答案")
+            return jsonify({"success": False, "error": "AI答题失败"}), 500
+        
+        prompt_tokens = usage_info.get('prompt_tokens', 0) if usage_info else 0
+        completion_tokens = usage_info.get('completion_tokens', 0) if usage_info else 0
+        
+        raw_answers = AnswerProcessor.split_batch_answers(raw_answer, len(items))
+        total_time = time.time() - start_time
+        reasoning_used = force_reasoning or (model_client.enable_reasoning if not custom_model_id else False)
+        
+        # token按题目数平均分摊（余数计入前几题），保证CSV中的费用合计准确
+        prompt_share, prompt_rest = divmod(prompt_tokens, len(items))
+        completion_share, completion_rest = divmod(completion_tokens, len(items))
+        
+        results = []
+        for i, ((question, options, q_type), item_answer) in enumerate(zip(items, raw_answers)):
+            processed_answer = AnswerProcessor.process_answer(item_answer, q_type, options) if item_answer else ''
+            print(f"{i + 1}. {question}\n   ✅ {processed_answer or '（未作答）'}")
+            
+            save_to_csv(
+                question=question,
+                options=options,
+                q_type=QUESTION_TYPE_NAMES.get(q_type, "未知题型"),
+                raw_answer=item_answer,
+                reasoning=reasoning if i == 0 else None,
+                processed_answer=processed_answer,
+                ai_time=ai_time,
+                total_time=total_time,
+                model_name=model_name,
+                reasoning_used=reasoning_used,
+                prompt_tokens=prompt_share + (1 if i < prompt_rest else 0),
+                completion_tokens=completion_share + (1 if i < completion_rest else 0),
+                provider=actual_provider
+            )
+            
+            results.append({
+                "success": bool(processed_answer),
+                "question": question,
+                "answer": processed_answer,
+                "type": q_type,
+                "raw_answer": item_answer
+            })
+        
+        print(f"⏱️  模型答题用时: {format_time(ai_time)}")
+        print(f"⏱️  总处理用时: {format_time(total_time)}")
+        print("="*80 + "\n")
+        
+        if custom_model_id:
+            response_provider = f"custom({custom_model_id})"
+        elif model_client.is_auto_mode:
+            response_provider = f"auto({actual_provider})"
+        else:
+            response_provider = model_client.provider
+        
+        return jsonify({
+            "success": True,
+            "results": results,
+            "model": model_name,
+            "provider": response_provider,
+            "reasoning_used": reasoning_used,
+            "ai_time": round(ai_time, 2),
+            "total_time": round(total_time, 2),
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        })
+    
+    except Exception as e:
+        logger.error(f"处理批量请求错误: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "error": f"服务器错误: {str(e)}"}), 500
+
+
 # ==================== API 路由 ====================
 
 @app.route('/api/health', methods=['GET'])
@@ -2467,27 +3082,52 @@ def health_check():
     })
 
 
-@app.route('/api/config', methods=['GET'])
-@require_auth
-def get_config():
-    """获取当前配置（需要认证）- 返回完整密钥"""
-    # 返回所有环境变量配置（用于配置面板）
+# /api/config 返回的、运行期间可能变化的环境变量：(变量名, 默认值)
+_CONFIG_ENV_DEFAULTS = (
+    ('DEEPSEEK_BASE_URL', 'https://api.deepseek.com'),
+    ('DEEPSEEK_MODEL', 'deepseek-chat'),
+    ('DOUBAO_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3'),
+    ('DOUBAO_MODEL', ''),
+    ('REASONING_MAX_TOKENS', '4096'),
+    ('TOP_P', '1.0'),
+    ('HTTP_PROXY', ''),
+    ('HTTPS_PROXY', ''),
+    ('TIMEOUT', '1200'),
+    ('MAX_RETRIES', '3'),
+    ('CSV_LOG_FILE', 'ocs_answers_log.csv'),
+    ('LOG_LEVEL', 'INFO')
+)
+# /api/config 静态部分的缓存，key 为上述环境变量的当前值
+_CONFIG_CACHE = {'key': None, 'value': None}
+
+
+def _static_config() -> Dict[str, str]:
+    """
+    /api/config 中来自环境变量和启动配置的部分（不含模型客户端状态）
+    
+    环境变量未变化时直接返回缓存的字典，调用方复制后再修改。
+    """
+    env = {name: os.environ.get(name) for name, _ in _CONFIG_ENV_DEFAULTS}
+    env['DEBUG'] = os.environ.get('DEBUG')
+    key = tuple(env.values())
+    if _CONFIG_CACHE['key'] == key:
+        return _CONFIG_CACHE['value']
+    
+    env_config = {name: str(env[name] if env[name] is not None else default)
+                  for name, default in _CONFIG_ENV_DEFAULTS}
     config = {
         # 模型提供商配置
         "MODEL_PROVIDER": MODEL_PROVIDER,
-        "AUTO_MODEL_SELECTION": str(model_client.is_auto_mode if model_client else False).lower(),
-        "PREFER_MODEL": getattr(model_client, 'prefer_model', '') if model_client else '',
-        "IMAGE_MODEL": getattr(model_client, 'image_model', '') if model_client else '',
         
         # DeepSeek 配置 - 返回完整密钥
         "DEEPSEEK_API_KEY": DEEPSEEK_API_KEY,
-        "DEEPSEEK_BASE_URL": os.getenv('DEEPSEEK_BASE_URL', 'https://api.deepseek.com'),
-        "DEEPSEEK_MODEL": os.getenv('DEEPSEEK_MODEL', 'deepseek-chat'),
+        "DEEPSEEK_BASE_URL": env_config['DEEPSEEK_BASE_URL'],
+        "DEEPSEEK_MODEL": env_config['DEEPSEEK_MODEL'],
         
         # 豆包配置 - 返回完整密钥
         "DOUBAO_API_KEY": DOUBAO_API_KEY,
-        "DOUBAO_BASE_URL": os.getenv('DOUBAO_BASE_URL', 'https://ark.cn-beijing.volces.com/api/v3'),
-        "DOUBAO_MODEL": os.getenv('DOUBAO_MODEL', ''),
+        "DOUBAO_BASE_URL": env_config['DOUBAO_BASE_URL'],
+        "DOUBAO_MODEL": env_config['DOUBAO_MODEL'],
         
         # 思考模式配置
         "ENABLE_REASONING": str(ENABLE_REASONING).lower(),
@@ -2498,22 +3138,35 @@ def get_config():
         # AI 参数配置
         "TEMPERATURE": str(TEMPERATURE),
         "MAX_TOKENS": str(MAX_TOKENS),
-        "REASONING_MAX_TOKENS": str(os.getenv('REASONING_MAX_TOKENS', '4096')),
-        "TOP_P": str(os.getenv('TOP_P', '1.0')),
+        "REASONING_MAX_TOKENS": env_config['REASONING_MAX_TOKENS'],
+        "TOP_P": env_config['TOP_P'],
         
         # 网络配置
-        "HTTP_PROXY": os.getenv('HTTP_PROXY', ''),
-        "HTTPS_PROXY": os.getenv('HTTPS_PROXY', ''),
-        "TIMEOUT": str(os.getenv('TIMEOUT', '1200')),
-        "MAX_RETRIES": str(os.getenv('MAX_RETRIES', '3')),
+        "HTTP_PROXY": env_config['HTTP_PROXY'],
+        "HTTPS_PROXY": env_config['HTTPS_PROXY'],
+        "TIMEOUT": env_config['TIMEOUT'],
+        "MAX_RETRIES": env_config['MAX_RETRIES'],
         
         # 系统配置
         "HOST": HOST,
         "PORT": str(PORT),
-        "DEBUG": str(os.getenv('DEBUG', 'false')).lower(),
-        "CSV_LOG_FILE": os.getenv('CSV_LOG_FILE', 'ocs_answers_log.csv'),
-        "LOG_LEVEL": os.getenv('LOG_LEVEL', 'INFO'),
+        "DEBUG": str(env['DEBUG'] if env['DEBUG'] is not None else 'false').lower(),
+        "CSV_LOG_FILE": env_config['CSV_LOG_FILE'],
+        "LOG_LEVEL": env_config['LOG_LEVEL'],
     }
+    _CONFIG_CACHE.update(key=key, value=config)
+    return config
+
+
+@app.route('/api/config', methods=['GET'])
+@require_auth
+def get_config():
+    """获取当前配置（需要认证）- 返回完整密钥"""
+    # 返回所有环境变量配置（用于配置面板）；环境变量部分来自缓存，模型客户端状态每次读取
+    config = dict(_static_config())
+    config["AUTO_MODEL_SELECTION"] = str(model_client.is_auto_mode if model_client else False).lower()
+    config["PREFER_MODEL"] = getattr(model_client, 'prefer_model', '') if model_client else ''
+    config["IMAGE_MODEL"] = getattr(model_client, 'image_model', '') if model_client else ''
     
     # 添加运行时信息（用于状态显示）
     config["_runtime"] = {
@@ -2527,6 +3180,56 @@ def get_config():
     return jsonify(config)
 
 
+def _format_env_line(key: str, value: Any) -> str:
+    """格式化一行 .env 配置，空值写为 KEY="""
+    if value == '' or value is None:
+        return f"{key}=\n"
+    return f"{key}={value}\n"
+
+
+def _update_env_content(content: str, config_data: Dict[str, Any]) -> Tuple[str, int, int]:
+    """
+    单次扫描 .env 内容，替换已有配置项的值，未出现过的配置项追加到末尾
+    
+    逐行用 str.find 定位换行和第一个 '='，'=' 前的内容去掉空白后作为键；
+    注释、空行、格式不正确的行以及不在 config_data 中的配置原样保留。
+    
+    Args:
+        content: 现有 .env 文件内容
+        config_data: 要保存的配置 {键: 值}
+    
+    Returns:
+        (新内容, 更新的配置项数, 新增的配置项数)
+    """
+    # 尚未在文件中出现的配置项（保持请求中的顺序）
+    pending = dict(config_data)
+    parts = []
+    updated_count = 0
+    pos = 0
+    size = len(content)
+    while pos < size:
+        line_end = content.find('\n', pos)
+        line_end = size if line_end < 0 else line_end + 1
+        eq = content.find('=', pos, line_end)
+        key = content[pos:eq].strip() if eq >= 0 else None
+        # 注释行（以 # 开头）即使包含 '=' 也不作为配置
+        if key is not None and not key.startswith('#') and key in config_data:
+            parts.append(_format_env_line(key, config_data[key]))
+            if key in pending:
+                del pending[key]
+                updated_count += 1
+        else:
+            # 保留注释、空行、格式不正确的行和原有配置
+            parts.append(content[pos:line_end])
+        pos = line_end
+    
+    if pending:
+        parts.append("\n# 新增配置项\n")
+        parts.extend(_format_env_line(key, value) for key, value in pending.items())
+    
+    return ''.join(parts), updated_count, len(pending)
+
+
 @app.route('/api/config', methods=['POST'])
 @require_auth
 def save_config():
@@ -2539,67 +3242,38 @@ def save_config():
         # .env 文件路径
         env_file = os.path.join(os.path.dirname(__file__), '.env')
         
-        # 读取现有的 .env 文件内容（逐行）
-        lines = []
+        # 读取现有的 .env 文件内容
+        content = ''
         if os.path.exists(env_file):
             with open(env_file, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-        
-        # 创建配置键到新值的映射
-        updated_keys = set()
+                content = f.read()
         
-        # 逐行处理，匹配并修改
-        new_lines = []
-        for line in lines:
-            stripped = line.strip()
-            
-            # 保留注释和空行
-            if not stripped or stripped.startswith('#'):
-                new_lines.append(line)
-                continue
-            
-            # 解析配置行
-            if '=' in stripped:
-                key = stripped.split('=', 1)[0].strip()
-                
-                # 如果这个key在更新数据中，替换它
-                if key in config_data:
-                    value = config_data[key]
-                    # 处理空值
-                    if value == '' or value is None:
-                        new_lines.append(f"{key}=\n")
-                    else:
-                        new_lines.append(f"{key}={value}\n")
-                    updated_keys.add(key)
-                else:
-                    # 保留原有配置
-                    new_lines.append(line)
-            else:
-                # 保留格式不正确的行
-                new_lines.append(line)
-        
-        # 添加新的配置项（如果有）
-        new_keys = set(config_data.keys()) - updated_keys
-        if new_keys:
-            new_lines.append("\n# 新增配置项\n")
-            for key in sorted(new_keys):
-                value = config_data[key]
-                if value == '' or value is None:
-                    new_lines.append(f"{key}=\n")
-                else:
-                    new_lines.append(f"{key}={value}\n")
+        new_content, updated_count, added_count = _update_env_content(content, config_data)
+        _CONFIG_CACHE['key'] = None
         
-        # 写入文件
-        with open(env_file, 'w', encoding='utf-8') as f:
-            f.writelines(new_lines)
+        # 写入文件：先一次性写入同目录的临时文件，再原子替换，保存中途出错不会留下写了一半的 .env
+        fd, tmp_file = tempfile.mkstemp(prefix='.env.', suffix='.tmp', dir=os.path.dirname(env_file))
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8', buffering=1 << 20) as f:
+                f.write(new_content)
+            if os.path.exists(env_file):
+                # 保持原文件的权限（mkstemp 创建的文件仅所有者可读写）
+                os.chmod(tmp_file, os.stat(env_file).st_mode & 0o7777)
+            os.replace(tmp_file, env_file)
+        except BaseException:
+            try:
+                os.remove(tmp_file)
+            except OSError:
+                pass
+            raise
         
-        logger.info(f"配置已保存到 {env_file}，更新了 {len(updated_keys)} 个配置项，新增了 {len(new_keys)} 个配置项")
+        logger.info(f"配置已保存到 {env_file}，更新了 {updated_count} 个配置项，新增了 {added_count} 个配置项")
         return jsonify({
             "success": True,
             "message": "配置已成功保存到 .env 文件",
             "file": env_file,
-            "updated": len(updated_keys),
-            "added": len(new_keys),
+            "updated": updated_count,
+            "added": added_count,
             "note": "请重启服务以应用新配置"
         })
         
@@ -2614,16 +3288,17 @@ def restart_server():
     """重启服务器（需要认证）"""
     try:
         import sys
-        import os
-        import threading
         import subprocess
         
         def do_restart():
-            """延迟重启以便响应返回"""
-            import time
-            time.sleep(1)  # 等待响应返回
+            """响应发送完成后重启（由 response.call_on_close 触发，无需固定等待）"""
             logger.info("正在重启服务器...")
             
+            # execv/os._exit 不会执行 atexit 注册的清理，先关闭CSV日志文件并刷新输出
+            _close_csv_file()
+            sys.stdout.flush()
+            sys.stderr.flush()
+            
             # 检测是否为 PyInstaller 打包环境
             if getattr(sys, 'frozen', False):
                 # 打包后的 exe 环境
@@ -2650,39 +3325,497 @@ def restart_server():
                                    creationflags=subprocess.CREATE_NEW_CONSOLE)
                     os._exit(0)
                 else:  # Linux/Mac
+                    # werkzeug 把监听套接字设为可继承（供重载器复用），execv 前取消继承，
+                    # 端口随 exec 释放，新进程可以直接绑定（重载器模式下新进程会复用该套接字，保持不变）
+                    from werkzeug.serving import is_running_from_reloader
+                    server_fd = os.environ.get('WERKZEUG_SERVER_FD')
+                    if server_fd and not is_running_from_reloader():
+                        os.set_inheritable(int(server_fd), False)
                     os.execv(python, [python, script])
         
-        # 在后台线程中执行重启
-        threading.Thread(target=do_restart, daemon=True).start()
-        
-        return jsonify({
+        response = jsonify({
             "success": True,
-            "message": "服务器将在 1 秒后重启"
+            "message": "服务器将在响应返回后重启"
         })
+        # 响应发送完毕、连接关闭时再重启，保证客户端收到响应
+        response.call_on_close(do_restart)
+        return response
         
     except Exception as e:
         logger.error(f"重启服务器失败: {str(e)}")
         return jsonify({"error": f"重启失败: {str(e)}"}), 500
 
 
+# ==================== CSV日志读取 ====================
+
+def _csv_filters_from_request() -> Dict[str, Any]:
+    """
+    从请求参数中读取CSV日志的筛选条件（/api/csv 与 /api/csv/stats 共用）
+    
+    日期边界在这里解析一次（date_bounds），之后判断和筛选都直接使用。
+    """
+    filters = {
+        'search': request.args.get('search', ''),
+        'type': request.args.get('type', ''),
+        'reasoning': request.args.get('reasoning', ''),
+        'date': request.args.get('date', 'all'),
+        'custom_date': request.args.get('custom_date', '')
+    }
+    filters['date_bounds'] = _csv_date_bounds(filters['date'], filters['custom_date'])
+    return filters
+
+
+def _date_int(value) -> int:
+    """把日期转换为 YYYYMMDD 整数"""
+    return value.year * 10000 + value.month * 100 + value.day
+
+
+# 日期上界不限时使用的值
+_CSV_DATE_MAX = 99999999
+
+
+def _csv_date_bounds(date_filter: str, custom_date: str) -> Optional[Tuple[int, int]]:
+    """
+    把日期筛选参数转换为 (起始日期, 结束日期)，均为 YYYYMMDD 整数（含两端）
+    
+    支持 today、week/7（近7天）、month/30（近30天）、custom（custom_date 为
+    "起始,结束" 或单个日期）。不筛选时返回None。
+    """
+    if not date_filter or date_filter == 'all':
+        return None
+    
+    today = datetime.now().date()
+    if date_filter == 'today':
+        return _date_int(today), _date_int(today)
+    if date_filter in ('week', '7'):
+        return _date_int(today - timedelta(days=7)), _CSV_DATE_MAX
+    if date_filter in ('month', '30'):
+        return _date_int(today - timedelta(days=30)), _CSV_DATE_MAX
+    if date_filter == 'custom' and custom_date:
+        date_range = custom_date.split(',')
+        try:
+            if len(date_range) == 2:
+                start_date = datetime.strptime(date_range[0].strip()[:10], '%Y-%m-%d').date()
+                end_date = datetime.strptime(date_range[1].strip()[:10], '%Y-%m-%d').date()
+            else:
+                start_date = end_date = datetime.strptime(custom_date.strip()[:10], '%Y-%m-%d').date()
+        except ValueError:
+            return None
+        return _date_int(start_date), _date_int(end_date)
+    return None
+
+
+def _csv_filters_active(filters: Dict[str, Any]) -> bool:
+    """是否设置了任何筛选条件"""
+    return bool(filters.get('search') or filters.get('type') or filters.get('reasoning')
+                or filters.get('date_bounds'))
+
+
+def _csv_sort_key(row: Dict[str, str]) -> str:
+    """CSV记录的排序键（时间戳）"""
+    return row.get('时间戳', '')
+
+
+# 拼接搜索文本时的列分隔符：搜索词不含该字符时，在拼接文本中查找等同于逐列查找
+_CSV_SEARCH_SEP = '\x00'
+
+
+def _csv_search_text(row: Dict[str, str]) -> str:
+    """把记录各列的小写文本拼接为一个字符串，用于全文搜索"""
+    return _CSV_SEARCH_SEP.join(v.lower() for v in row.values() if v and isinstance(v, str))
+
+
+def _csv_date_int(row: Dict[str, str]) -> int:
+    """把记录时间戳的日期部分转换为 YYYYMMDD 整数，无时间戳或格式不对时为0"""
+    date = row.get('时间戳', '')[:10]
+    if len(date) == 10 and date[4] == '-' and date[7] == '-':
+        digits = date[:4] + date[5:7] + date[8:]
+        if digits.isascii() and digits.isdigit():
+            return int(digits)
+    return 0
+
+
+# CSV日志解析缓存：日志只会追加，按 (路径, 修改时间, 大小) 判断是否需要重新解析
+# rows 为文件顺序，rows_sorted 为时间倒序，order 为 rows_sorted 各记录在 rows 中的下标，
+# stats 为无筛选条件时的统计结果；
+# sort_keys 为 rows_sorted 的排序键按升序排列（即 rows_sorted 逆序的键），用于 bisect 插入新记录；
+# columns 为与 rows 对齐的数值列（解析一次，统计时直接累加），dates 为与 rows 对齐的
+# YYYYMMDD 日期整数（日期筛选时直接比较整数）；
+# search_texts 为与 rows 对齐的小写搜索文本，第一次搜索时才生成；
+# offset/inode/fieldnames/tail_sig 用于只解析新追加的内容
+_csv_cache_lock = threading.Lock()
+# 解析日志文件时持有，保证同一时间只有一次解析
+_csv_load_lock = threading.Lock()
+_CSV_CACHE = {
+    'key': None, 'rows': None, 'rows_sorted': None, 'order': None, 'sort_keys': None,
+    'columns': None, 'dates': None, 'search_texts': None, 'stats': None,
+    'offset': 0, 'inode': None, 'fieldnames': None, 'tail_sig': b''
+}
+# 校验已解析内容未被改写时比较的末尾字节数
+_CSV_TAIL_SIG_BYTES = 64
+
+
+def _invalidate_csv_cache():
+    """清空CSV解析缓存（清空日志文件后调用）"""
+    with _csv_cache_lock:
+        _CSV_CACHE.update(key=None, rows=None, rows_sorted=None, order=None, sort_keys=None,
+                          columns=None, dates=None, search_texts=None, stats=None,
+                          offset=0, inode=None, fieldnames=None, tail_sig=b'')
+
+
+# 统计用数值列：(列名, CSV表头, 类型)
+_CSV_NUMERIC_COLUMNS = (
+    ('ai_time', 'AI耗时(秒)', float),
+    ('total_time', '总耗时(秒)', float),
+    ('cost', '费用(元)', float),
+    ('total_tokens', '总Token', int),
+    ('input_tokens', '输入Token', int),
+    ('output_tokens', '输出Token', int)
+)
+# AI耗时分布的区间上界（含），超过最后一个为"10秒以上"
+_CSV_TIME_RANGE_BOUNDS = (2, 5, 10)
+_CSV_TIME_RANGE_LABELS = ('0-2秒', '2-5秒', '5-10秒', '10秒以上')
+
+
+def _csv_number(value: Optional[str], cast):
+    """把CSV字段转换为数值，空值或无法解析时为0"""
+    try:
+        return cast(value or 0)
+    except (ValueError, TypeError):
+        return cast(0)
+
+
+def _build_csv_columns(rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    """预先解析统计用的数值列（安装了numpy时为ndarray，否则为list）"""
+    columns = {}
+    for name, header, cast in _CSV_NUMERIC_COLUMNS:
+        values = [_csv_number(row.get(header), cast) for row in rows]
+        if _HAS_NUMPY:
+            values = np.array(values, dtype=np.float64 if cast is float else np.int64)
+        columns[name] = values
+    return columns
+
+
+def _extend_csv_columns(columns: Dict[str, Any], new_rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    """返回追加了新记录数值的列（不修改原列，保证缓存快照只读）"""
+    new_columns = _build_csv_columns(new_rows)
+    if _HAS_NUMPY:
+        return {name: np.concatenate((columns[name], new_columns[name])) for name in columns}
+    return {name: columns[name] + new_columns[name] for name in columns}
+
+
+def _parse_csv_bytes(data: bytes, fieldnames: Optional[List[str]] = None,
+                     strict: bool = False) -> Tuple[List[Dict[str, str]], Optional[List[str]]]:
+    """
+    解析CSV字节内容（换行处理与文本模式读取一致）
+    
+    用 csv.reader 读取，列数与表头一致的行直接 dict(zip(...)) 构造记录，
+    省去 csv.DictReader 逐行的Python层检查；列数不一致的行与 DictReader 相同：
+    缺少的列为None，多出的值放在键None下，空行跳过。
+    
+    Returns:
+        (记录列表, 表头)
+    """
+    reader = csv.reader(TextIOWrapper(BytesIO(data), encoding='utf-8-sig'), strict=strict)
+    if fieldnames is None:
+        fieldnames = next(reader, None)
+        if fieldnames is None:
+            return [], None
+    
+    field_count = len(fieldnames)
+    rows = []
+    append = rows.append
+    for row in reader:
+        if not row:
+            continue
+        if len(row) == field_count:
+            append(dict(zip(fieldnames, row)))
+        else:
+            record = dict(zip(fieldnames, row))
+            if len(row) > field_count:
+                record[None] = row[field_count:]
+            else:
+                for name in fieldnames[len(row):]:
+                    record[name] = None
+            append(record)
+    return rows, fieldnames
+
+
+def _parse_csv_arrow(data: bytes) -> Optional[Tuple[List[Dict[str, str]], List[str], Dict[str, Any]]]:
+    """
+    用pyarrow解析整个CSV文件，同时在C++中完成数值列转换
+    
+    所有列按字符串读取，换行按文本模式统一为\\n，结果与 _parse_csv_bytes 一致。
+    
+    Returns:
+        (记录列表, 表头, 数值列)；未安装pyarrow或内容不规整（列数不一致等）时返回None，
+        由调用方回退到csv模块
+    """
+    if not _HAS_PYARROW:
+        return None
+    if data.startswith(codecs.BOM_UTF8):
+        data = data[len(codecs.BOM_UTF8):]
+    data = data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
+    try:
+        header = next(csv.reader(TextIOWrapper(BytesIO(data), encoding='utf-8')), None)
+        # 空文件或表头重复时交给csv模块（DictReader按后出现的列取值）
+        if not header or len(set(header)) != len(header):
+            return None
+        table = pa_csv.read_csv(
+            BytesIO(data),
+            read_options=pa_csv.ReadOptions(block_size=1 << 20),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(column_types={name: pa.string() for name in header})
+        )
+    except (pa.ArrowException, csv.Error, UnicodeDecodeError):
+        return None
+    if table.column_names != header:
+        return None
+    
+    rows = table.to_pylist()
+    columns = {}
+    for name, column_header, cast in _CSV_NUMERIC_COLUMNS:
+        values = None
+        if column_header in header:
+            column = table[column_header]
+            try:
+                column = pa_compute.if_else(pa_compute.equal(column, ''), '0', column)
+                column = pa_compute.cast(column, pa.float64() if cast is float else pa.int64())
+                values = column.to_numpy() if _HAS_NUMPY else column.to_pylist()
+            except pa.ArrowException:
+                # 有无法解析的值：按 _csv_number 的规则逐个转换（无效值记为0）
+                values = None
+        if values is None:
+            values = [_csv_number(row.get(column_header), cast) for row in rows]
+            if _HAS_NUMPY:
+                values = np.array(values, dtype=np.float64 if cast is float else np.int64)
+        columns[name] = values
+    return rows, header, columns
+
+
+def _load_csv_cache(csv_file: str) -> Dict[str, Any]:
+    """
+    获取CSV日志的解析结果，文件未变化时直接复用缓存
+    
+    文件只是追加了内容时（同一inode、大小未减少、已解析部分的末尾字节未变），
+    只解析新增的字节；被截断、替换或改写时重新解析整个文件。
+    
+    Returns:
+        dict: 缓存快照 {'key', 'rows', 'rows_sorted', 'stats', ...}，调用方只读不改
+    """
+    st = os.stat(csv_file)
+    key = (csv_file, st.st_mtime_ns, st.st_size)
+    with _csv_cache_lock:
+        if _CSV_CACHE['key'] == key:
+            return dict(_CSV_CACHE)
+    
+    # 同一时间只由一个线程解析；并发的请求等待解析完成后直接复用结果，不重复解析
+    with _csv_load_lock:
+        with _csv_cache_lock:
+            if _CSV_CACHE['key'] == key:
+                return dict(_CSV_CACHE)
+            cached = dict(_CSV_CACHE)
+        
+        rows = None
+        with open(csv_file, 'rb', buffering=1 << 20) as f:
+            offset = cached['offset']
+            if (cached['key'] and cached['key'][0] == csv_file and cached['inode'] == st.st_ino
+                    and cached['fieldnames'] and offset <= st.st_size):
+                sig_start = max(0, offset - _CSV_TAIL_SIG_BYTES)
+                f.seek(sig_start)
+                data = f.read()
+                new_data = data[offset - sig_start:]
+                # 只在新增内容是完整行时增量解析，否则（可能正在写入）重新解析
+                if data[:offset - sig_start] == cached['tail_sig'] and new_data.endswith(b'\n'):
+                    try:
+                        new_rows, _ = _parse_csv_bytes(new_data, cached['fieldnames'], strict=True)
+                    except csv.Error:
+                        new_rows = None
+                    if new_rows is not None:
+                        rows = cached['rows'] + new_rows
+                        columns = _extend_csv_columns(cached['columns'], new_rows)
+                        dates = cached['dates'] + [_csv_date_int(row) for row in new_rows]
+                        search_texts = cached['search_texts']
+                        if search_texts is not None:
+                            search_texts = search_texts + [_csv_search_text(row) for row in new_rows]
+                        # 新记录按时间插入已排序列表，无需整体重新排序
+                        # （日志按时间追加，通常直接插到最前面）
+                        rows_sorted = list(cached['rows_sorted'])
+                        order = list(cached['order'])
+                        sort_keys = list(cached['sort_keys'])
+                        for row_index, row in enumerate(new_rows, len(cached['rows'])):
+                            row_key = _csv_sort_key(row)
+                            # bisect_left：与已有记录时间相同时排在它们之后（倒序中），与稳定排序一致
+                            index = bisect.bisect_left(sort_keys, row_key)
+                            sort_keys.insert(index, row_key)
+                            rows_sorted.insert(len(rows_sorted) - index, row)
+                            order.insert(len(order) - index, row_index)
+                        fieldnames = cached['fieldnames']
+                        offset = sig_start + len(data)
+                        tail_sig = data[-_CSV_TAIL_SIG_BYTES:]
+        
+            if rows is None:
+                f.seek(0)
+                data = f.read()
+                offset = len(data)
+                tail_sig = data[-_CSV_TAIL_SIG_BYTES:]
+                parsed = _parse_csv_arrow(data)
+                if parsed is not None:
+                    rows, fieldnames, columns = parsed
+                else:
+                    try:
+                        rows, fieldnames = _parse_csv_bytes(data, strict=True)
+                    except csv.Error:
+                        # 格式不严格或最后一行正在写入：宽松解析，下次重新解析整个文件
+                        rows, fieldnames = _parse_csv_bytes(data)
+                        fieldnames = None
+                    columns = _build_csv_columns(rows)
+                if not data.endswith(b'\n'):
+                    # 最后一行不完整，下次重新解析
+                    fieldnames = None
+                row_keys = [_csv_sort_key(row) for row in rows]
+                order = sorted(range(len(rows)), key=row_keys.__getitem__, reverse=True)
+                rows_sorted = [rows[i] for i in order]
+                sort_keys = [row_keys[i] for i in reversed(order)]
+                dates = [_csv_date_int(row) for row in rows]
+                search_texts = None
+    
+        snapshot = {
+            'key': key,
+            'rows': rows,
+            'rows_sorted': rows_sorted,
+            'order': order,
+            'sort_keys': sort_keys,
+            'columns': columns,
+            'dates': dates,
+            'search_texts': search_texts,
+            'stats': None,
+            'offset': offset,
+            'inode': st.st_ino,
+            'fieldnames': fieldnames,
+            'tail_sig': tail_sig
+        }
+        with _csv_cache_lock:
+            _CSV_CACHE.update(snapshot)
+        return snapshot
+
+
+def _csv_search_texts(cache: Dict[str, Any]) -> List[str]:
+    """获取与 cache['rows'] 对齐的搜索文本，第一次搜索时生成并保存到缓存"""
+    search_texts = cache.get('search_texts')
+    if search_texts is None:
+        search_texts = [_csv_search_text(row) for row in cache['rows']]
+        cache['search_texts'] = search_texts
+        with _csv_cache_lock:
+            if _CSV_CACHE['key'] == cache['key']:
+                _CSV_CACHE['search_texts'] = search_texts
+    return search_texts
+
+
+def _build_csv_predicates(cache: Dict[str, Any], filters: Dict[str, Any]) -> List[Any]:
+    """
+    把筛选条件编译为谓词函数列表，每个请求只构建一次
+    
+    谓词按开销从小到大排列（题型、思考模式的等值比较，日期整数比较，全文搜索），
+    all() 遇到第一个不通过的谓词即停止。
+    
+    Args:
+        cache: _load_csv_cache() 返回的缓存快照
+        filters: _csv_filters_from_request() 返回的筛选条件
+    
+    Returns:
+        List[Callable[[int], bool]]: 以 cache['rows'] 下标为参数、记录需全部通过的谓词，
+        未设置的条件不生成谓词
+    """
+    rows = cache['rows']
+    predicates = []
+    
+    question_type = filters.get('type', '')
+    if question_type:
+        predicates.append(lambda i: rows[i].get('题型', '') == question_type)
+    
+    # 思考模式筛选同时兼容 是/否 与 思考模式/普通模式 两种取值
+    reasoning = filters.get('reasoning', '')
+    if reasoning in ('是', '思考模式'):
+        predicates.append(lambda i: rows[i].get('思考模式', '') == '是')
+    elif reasoning in ('否', '普通模式'):
+        predicates.append(lambda i: rows[i].get('思考模式', '') != '是')
+    
+    # 日期边界在读取参数时已转换为 YYYYMMDD 整数，与预先计算的日期列直接比较；无时间戳的记录保留
+    date_bounds = filters.get('date_bounds')
+    if date_bounds:
+        dates = cache['dates']
+        start_date, end_date = date_bounds
+        predicates.append(lambda i: not dates[i] or start_date <= dates[i] <= end_date)
+    
+    # 全文搜索最慢，放在最后：被前面条件排除的记录不再逐列查找
+    search = filters.get('search', '').lower()
+    if search and _CSV_SEARCH_SEP in search:
+        # 搜索词包含分隔符时逐列查找，避免跨列匹配
+        predicates.append(lambda i: any(
+            search in v.lower() for v in rows[i].values() if v and isinstance(v, str)))
+    elif search:
+        # 在预先拼接的小写文本中查找，每条记录只需一次子串查找
+        search_texts = _csv_search_texts(cache)
+        predicates.append(lambda i: search in search_texts[i])
+    
+    return predicates
+
+
+def _select_csv_indices(cache: Dict[str, Any], filters: Dict[str, Any], indices) -> List[int]:
+    """
+    筛选CSV记录，返回通过筛选条件的记录下标
+    
+    Args:
+        cache: _load_csv_cache() 返回的缓存快照
+        filters: _csv_filters_from_request() 返回的筛选条件
+        indices: 参与筛选的 cache['rows'] 下标，结果保持其顺序
+    
+    Returns:
+        List[int]: 通过筛选的记录下标
+    """
+    predicates = _build_csv_predicates(cache, filters)
+    if not predicates:
+        return list(indices)
+    if len(predicates) == 1:
+        predicate = predicates[0]
+        return [i for i in indices if predicate(i)]
+    return [i for i in indices if all(predicate(i) for predicate in predicates)]
+
+
+# 导出全部记录时每批序列化的记录数
+_CSV_EXPORT_CHUNK_ROWS = 500
+
+
+def _stream_csv_rows_json(rows: List[Dict[str, str]]):
+    """
+    分批把记录序列化为JSON输出，内容与 jsonify({"data": rows, "total": len(rows)}) 一致
+    
+    避免一次性生成整个响应字符串，导出大量记录时内存占用只与每批大小有关。
+    """
+    dumps = app.json.dumps
+    yield '{"data":['
+    for start in range(0, len(rows), _CSV_EXPORT_CHUNK_ROWS):
+        chunk = rows[start:start + _CSV_EXPORT_CHUNK_ROWS]
+        yield (',' if start else '') + ','.join(dumps(row, separators=(',', ':')) for row in chunk)
+    yield '],"total":%d}\n' % len(rows)
+
+
 @app.route('/api/csv/stats', methods=['GET'])
 def get_csv_stats():
     """获取CSV统计数据（支持筛选）"""
     csv_file = os.getenv('CSV_LOG_FILE', 'ocs_answers_log.csv')
-    
-    # 获取筛选参数
-    search = request.args.get('search', '')
-    question_type = request.args.get('type', '')
-    reasoning = request.args.get('reasoning', '')
-    date_filter = request.args.get('date', 'all')
-    custom_date = request.args.get('custom_date', '')
+    filters = _csv_filters_from_request()
     
     try:
         if not os.path.exists(csv_file):
             return jsonify({"error": "CSV文件不存在"}), 404
         
-        # 读取并解析CSV
-        import csv as csv_module
+        cache = _load_csv_cache(csv_file)
+        filters_active = _csv_filters_active(filters)
+        if not filters_active and cache['stats'] is not None:
+            return jsonify(cache['stats'])
+        
         stats = {
             'total': 0,
             'avgTime': 0,
@@ -2693,75 +3826,90 @@ def get_csv_stats():
             'inputTokens': 0,
             'outputTokens': 0,
             'typeCounts': {},
-            'timeRanges': {'0-2秒': 0, '2-5秒': 0, '5-10秒': 0, '10秒以上': 0},
+            'timeRanges': dict.fromkeys(_CSV_TIME_RANGE_LABELS, 0),
             'reasoningCounts': {'思考模式': 0, '普通模式': 0},
             'dailyCounts': {}
         }
         
-        with open(csv_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv_module.DictReader(f)
-            total_ai_time = 0
-            
-            for row in reader:
-                # 应用筛选
-                row_text = '|'.join(row.values()).lower()
-                if search and search.lower() not in row_text:
-                    continue
-                if question_type and row.get('题型', '') != question_type:
-                    continue
-                if reasoning and row.get('思考模式', '') != reasoning:
-                    continue
-                # TODO: 日期筛选
-                
-                # 统计
-                stats['total'] += 1
-                
-                # AI耗时
-                ai_time = float(row.get('AI耗时(秒)', 0) or 0)
+        rows = cache['rows']
+        columns = cache['columns']
+        # 通过筛选的记录下标，None 表示全部记录
+        selected = None
+        if filters_active:
+            selected = _select_csv_indices(cache, filters, range(len(rows)))
+        stats['total'] = len(rows) if selected is None else len(selected)
+        
+        # 数值统计：使用缓存中预先解析的数值列
+        if _HAS_NUMPY:
+            index = slice(None) if selected is None else np.array(selected, dtype=np.intp)
+            ai_times = columns['ai_time'][index]
+            total_ai_time = float(ai_times.sum())
+            total_time = float(columns['total_time'][index].sum())
+            stats['totalCost'] += float(columns['cost'][index].sum())
+            stats['totalTokens'] += int(columns['total_tokens'][index].sum())
+            stats['inputTokens'] += int(columns['input_tokens'][index].sum())
+            stats['outputTokens'] += int(columns['output_tokens'][index].sum())
+            # 耗时分布：区间为 (上一个上界, 上界]
+            range_counts = np.bincount(
+                np.searchsorted(_CSV_TIME_RANGE_BOUNDS, ai_times, side='left'),
+                minlength=len(_CSV_TIME_RANGE_LABELS))
+            for label, count in zip(_CSV_TIME_RANGE_LABELS, range_counts):
+                stats['timeRanges'][label] = int(count)
+        else:
+            ai_col = columns['ai_time']
+            total_time_col = columns['total_time']
+            cost_col = columns['cost']
+            total_tokens_col = columns['total_tokens']
+            input_tokens_col = columns['input_tokens']
+            output_tokens_col = columns['output_tokens']
+            time_ranges = stats['timeRanges']
+            total_ai_time = 0.0
+            total_time = 0.0
+            for i in (range(len(rows)) if selected is None else selected):
+                ai_time = ai_col[i]
                 total_ai_time += ai_time
-                
-                # 总耗时
-                stats['totalTime'] += float(row.get('总耗时(秒)', 0) or 0)
-                
-                # 费用
-                stats['totalCost'] += float(row.get('费用(元)', 0) or 0)
-                
-                # Token统计
-                stats['totalTokens'] += int(row.get('总Token', 0) or 0)
-                stats['inputTokens'] += int(row.get('输入Token', 0) or 0)
-                stats['outputTokens'] += int(row.get('输出Token', 0) or 0)
-                
-                # 思考模式
-                if row.get('思考模式', '') == '是':
-                    stats['reasoningCount'] += 1
-                    stats['reasoningCounts']['思考模式'] += 1
-                else:
-                    stats['reasoningCounts']['普通模式'] += 1
-                
-                # 题型分布
-                q_type = row.get('题型', '未知')
-                stats['typeCounts'][q_type] = stats['typeCounts'].get(q_type, 0) + 1
+                total_time += total_time_col[i]
+                stats['totalCost'] += cost_col[i]
+                stats['totalTokens'] += total_tokens_col[i]
+                stats['inputTokens'] += input_tokens_col[i]
+                stats['outputTokens'] += output_tokens_col[i]
                 
                 # 耗时分布
                 if ai_time <= 2:
-                    stats['timeRanges']['0-2秒'] += 1
+                    time_ranges['0-2秒'] += 1
                 elif ai_time <= 5:
-                    stats['timeRanges']['2-5秒'] += 1
+                    time_ranges['2-5秒'] += 1
                 elif ai_time <= 10:
-                    stats['timeRanges']['5-10秒'] += 1
+                    time_ranges['5-10秒'] += 1
                 else:
-                    stats['timeRanges']['10秒以上'] += 1
-                
-                # 每日答题量
-                timestamp = row.get('时间戳', '')
-                if timestamp:
-                    date = timestamp.split(' ')[0]
-                    stats['dailyCounts'][date] = stats['dailyCounts'].get(date, 0) + 1
+                    time_ranges['10秒以上'] += 1
+        
+        # 分类统计：每个维度用 Counter 一次性计数
+        selected_rows = rows if selected is None else [rows[i] for i in selected]
+        
+        # 思考模式
+        reasoning_count = Counter(row.get('思考模式', '') for row in selected_rows)['是']
+        stats['reasoningCount'] = reasoning_count
+        stats['reasoningCounts']['思考模式'] = reasoning_count
+        stats['reasoningCounts']['普通模式'] = stats['total'] - reasoning_count
+        
+        # 题型分布
+        stats['typeCounts'] = dict(Counter(row.get('题型', '未知') for row in selected_rows))
+        
+        # 每日答题量
+        stats['dailyCounts'] = dict(Counter(
+            timestamp.split(' ')[0] for timestamp in (row.get('时间戳', '') for row in selected_rows) if timestamp))
         
         # 计算平均值
         if stats['total'] > 0:
             stats['avgTime'] = total_ai_time / stats['total']
-            stats['totalTime'] = stats['totalTime'] / 60  # 转换为分钟
+            stats['totalTime'] = total_time / 60  # 转换为分钟
+        
+        # 无筛选条件的统计结果随解析缓存一起保存，文件变化后自动失效
+        if not filters_active:
+            with _csv_cache_lock:
+                if _CSV_CACHE['key'] == cache['key']:
+                    _CSV_CACHE['stats'] = stats
         
         return jsonify(stats)
         
@@ -2781,84 +3929,25 @@ def get_csv():
     export_all = request.args.get('export', '') == 'true'  # 是否导出全部数据
     
     # 获取筛选参数
-    search = request.args.get('search', '')
-    question_type = request.args.get('type', '')
-    reasoning = request.args.get('reasoning', '')
-    date_filter = request.args.get('date', 'all')
-    custom_date = request.args.get('custom_date', '')
+    filters = _csv_filters_from_request()
     
     try:
         if not os.path.exists(csv_file):
             return jsonify({"error": "CSV文件不存在"}), 404
         
-        # 使用DictReader解析CSV为字典列表
-        all_data = []
-        with open(csv_file, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                # 应用筛选
-                if search and search.lower() not in str(row).lower():
-                    continue
-                if question_type and row.get('题型', '') != question_type:
-                    continue
-                if reasoning:
-                    if reasoning == '思考模式':
-                        if row.get('思考模式', '否') == '否':
-                            continue
-                    elif reasoning == '普通模式':
-                        if row.get('思考模式', '否') != '否':
-                            continue
-                
-                # 日期筛选
-                if date_filter != 'all':
-                    timestamp = row.get('时间戳', '')
-                    if timestamp:
-                        try:
-                            from datetime import datetime, timedelta
-                            record_date = datetime.strptime(timestamp.split()[0], '%Y-%m-%d')
-                            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
-                            
-                            if date_filter == 'today':
-                                if record_date.date() != today.date():
-                                    continue
-                            elif date_filter == 'week':
-                                week_ago = today - timedelta(days=7)
-                                if record_date < week_ago:
-                                    continue
-                            elif date_filter == 'month':
-                                month_ago = today - timedelta(days=30)
-                                if record_date < month_ago:
-                                    continue
-                            elif date_filter == 'custom' and custom_date:
-                                date_range = custom_date.split(',')
-                                if len(date_range) == 2:
-                                    start_date = datetime.strptime(date_range[0], '%Y-%m-%d')
-                                    end_date = datetime.strptime(date_range[1], '%Y-%m-%d')
-                                    if not (start_date <= record_date <= end_date):
-                                        continue
-                        except:
-                            pass
-                
-                all_data.append(row)
-        
-        # 按时间戳倒序排序（最新的在前面）
-        all_data.sort(key=lambda x: x.get('时间戳', ''), reverse=True)
-        
-        total = len(all_data)
-        
-        # 如果是导出全部数据
-        if export_all:
-            return jsonify({
-                "data": all_data,
-                "total": total
-            })
+        # 按缓存中的时间倒序（最新的在前面）筛选，筛选后顺序不变
+        cache = _load_csv_cache(csv_file)
+        if _csv_filters_active(filters):
+            rows = cache['rows']
+            filtered_rows = [rows[i] for i in _select_csv_indices(cache, filters, cache['order'])]
+        else:
+            # 无筛选条件：直接使用已排序的记录（缓存快照只读，分页切片会复制）
+            filtered_rows = cache['rows_sorted']
+        total = len(filtered_rows)
         
-        # 如果没有分页参数，返回全部数据
-        if page is None or page_size is None:
-            return jsonify({
-                "data": all_data,
-                "total": total
-            })
+        # 导出全部数据或没有分页参数时，分批流式返回全部数据
+        if export_all or page is None or page_size is None:
+            return Response(_stream_csv_rows_json(filtered_rows), mimetype='application/json')
         
         # 分页处理
         total_pages = (total + page_size - 1) // page_size if total > 0 else 0
@@ -2868,7 +3957,7 @@ def get_csv():
         if start >= total or start < 0:
             paginated_data = []
         else:
-            paginated_data = all_data[start:end]
+            paginated_data = filtered_rows[start:end]
         
         return jsonify({
             "data": paginated_data,
@@ -2897,10 +3986,13 @@ def clear_csv():
             '输入Token', '输出Token', '总Token', '费用(元)', '提供商'
         ]
         
-        # 写入空文件（只保留表头）
-        with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
-            writer = csv.writer(f)
-            writer.writerow(headers)
+        # 写入空文件（只保留表头），先关闭持久写入句柄，下次记录时重新打开
+        with _csv_lock:
+            _close_csv_file()
+            with open(csv_file, 'w', newline='', encoding='utf-8-sig') as f:
+                writer = csv.writer(f)
+                writer.writerow(headers)
+        _invalidate_csv_cache()
         
         logger.info(f"CSV文件已清空: {csv_file}")
         return jsonify({
@@ -3272,11 +4364,89 @@ def auth_status():
 
 # ==================== Vue SPA 静态文件服务 ====================
 
+# Vite 打包的静态资源文件名带内容哈希，内容变化时文件名随之变化，可长期缓存
+_ASSETS_MAX_AGE = 31536000
+
+# HTML页面缓存：{文件路径: (修改时间, 大小, UTF-8编码的内容, ETag)}，文件变化后自动重新读取
+_HTML_CACHE: Dict[str, Tuple[int, int, bytes, str]] = {}
+
+
+def _read_html_file(html_file: str, transform=None) -> Tuple[bytes, str]:
+    """
+    读取HTML页面（UTF-8编码后的字节），文件未变化时直接返回缓存内容
+    
+    Args:
+        html_file: HTML文件路径
+        transform: 可选，对读取的文本做的处理（处理结果一起缓存，不会每次请求重复执行）
+    
+    Returns:
+        (页面内容, ETag)
+    
+    Raises:
+        FileNotFoundError: 文件不存在
+    """
+    st = os.stat(html_file)
+    cached = _HTML_CACHE.get(html_file)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2], cached[3]
+    
+    with open(html_file, 'r', encoding='utf-8') as f:
+        html_content = f.read()
+    if transform:
+        html_content = transform(html_content)
+    content = html_content.encode('utf-8')
+    etag = hashlib.md5(content).hexdigest()
+    _HTML_CACHE[html_file] = (st.st_mtime_ns, st.st_size, content, etag)
+    return content, etag
+
+
+def _html_page_response(html_file: str, transform=None):
+    """
+    返回HTML页面响应，带 ETag 和 Cache-Control: no-cache
+    
+    浏览器每次都会校验，页面未变化时（If-None-Match 命中）返回 304，不重复传输页面内容。
+    
+    Raises:
+        FileNotFoundError: 文件不存在
+    """
+    html_content, etag = _read_html_file(html_file, transform)
+    response = make_response(html_content)
+    response.headers['Content-Type'] = 'text/html; charset=utf-8'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
+
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
     """提供Vue打包后的静态资源"""
     dist_dir = os.path.join(os.path.dirname(__file__), 'dist', 'assets')
-    return send_from_directory(dist_dir, filename)
+    response = send_from_directory(dist_dir, filename, max_age=_ASSETS_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={_ASSETS_MAX_AGE}, immutable'
+    return response
+
+
+# 延迟测试响应的固定响应头
+_LATENCY_PROBE_HEADERS = {
+    'Content-Type': 'text/plain; charset=utf-8',
+    'X-Service': 'OCS AI Answerer',
+    'X-Version': '3.0.0'
+}
+
+
+def _latency_probe_response(timestamp: str):
+    """
+    延迟测试响应（OCS 脚本轮询 /?t=客户端毫秒时间戳）
+    
+    X-Latency 为服务器收到请求的时间与客户端时间戳之差，用整数纳秒计算后再换算为毫秒。
+    """
+    response = Response('OK' if request.method == 'GET' else '', headers=_LATENCY_PROBE_HEADERS)
+    try:
+        latency_ns = time.time_ns() - int(timestamp) * 1000000
+        response.headers['X-Latency'] = f"{latency_ns / 1e6:.2f}ms"
+    except ValueError:
+        pass
+    return response
 
 
 @app.route('/', defaults={'path': ''})
@@ -3295,43 +4465,21 @@ def serve_spa(path):
     # 延迟测试（向后兼容旧的 OCS 脚本）
     timestamp = request.args.get('t', None)
     if timestamp and request.method in ['HEAD', 'GET']:
-        response = make_response('', 200)
-        response.headers['Content-Type'] = 'text/plain; charset=utf-8'
-        response.headers['X-Service'] = 'OCS AI Answerer'
-        response.headers['X-Version'] = '3.0.0'
-        
-        try:
-            client_timestamp = int(timestamp) / 1000
-            server_timestamp = time.time()
-            latency = (server_timestamp - client_timestamp) * 1000
-            response.headers['X-Latency'] = f"{latency:.2f}ms"
-        except (ValueError, TypeError):
-            pass
-        
-        if request.method == 'GET':
-            response.set_data('OK')
-        
-        return response
+        return _latency_probe_response(timestamp)
     
     # 服务 Vue SPA
-    dist_dir = os.path.join(os.path.dirname(__file__), 'dist')
-    index_file = os.path.join(dist_dir, 'index.html')
+    index_file = os.path.join(os.path.dirname(__file__), 'dist', 'index.html')
     
-    # 如果 dist 目录不存在，提示需要构建前端
-    if not os.path.exists(dist_dir) or not os.path.exists(index_file):
+    # 返回 Vue 应用的 index.html
+    try:
+        return _html_page_response(index_file)
+    except FileNotFoundError:
+        # 如果 dist 目录不存在，提示需要构建前端
         return jsonify({
             "error": "前端应用未构建",
             "message": "请先构建前端应用：cd frontend && npm install && npm run build",
             "note": "或者使用旧版HTML界面，访问 /config_legacy"
         }), 503
-    
-    # 返回 Vue 应用的 index.html
-    try:
-        with open(index_file, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        response = make_response(html_content)
-        response.headers['Content-Type'] = 'text/html; charset=utf-8'
-        return response
     except Exception as e:
         logger.error(f"加载Vue应用失败: {str(e)}")
         return jsonify({"error": f"加载前端应用失败: {str(e)}"}), 500
@@ -3345,49 +4493,41 @@ def config_panel_legacy():
     html_file = os.path.join(os.path.dirname(__file__), 'config_panel.html')
     
     try:
-        if os.path.exists(html_file):
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            response = make_response(html_content)
-            response.headers['Content-Type'] = 'text/html; charset=utf-8'
-            return response
-        else:
-            return jsonify({"error": "配置面板文件不存在"}), 404
+        return _html_page_response(html_file)
+    except FileNotFoundError:
+        return jsonify({"error": "配置面板文件不存在"}), 404
     except Exception as e:
         logger.error(f"加载配置面板失败: {str(e)}")
         return jsonify({"error": f"加载配置面板失败: {str(e)}"}), 500
 
 
+def _patch_viewer_html(html_content: str) -> str:
+    """修改旧版可视化页面中的fetch路径和Chart.js地址，使其指向Flask API和CDN"""
+    html_content = html_content.replace(
+        "fetch('ocs_answers_log.csv')",
+        "fetch('/api/csv')"
+    )
+    html_content = html_content.replace(
+        'fetch("ocs_answers_log.csv")',
+        'fetch("/api/csv")'
+    )
+    html_content = html_content.replace(
+        '<script src="chart.js.min.js"></script>',
+        '<script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"></script>'
+    )
+    return html_content
+
+
 @app.route('/viewer_legacy', methods=['GET'])
 def viewer_legacy():
     """答题记录可视化页面 (旧版HTML)"""
     html_file = os.path.join(os.path.dirname(__file__), 'ocs_answers_viewer.html')
     
     try:
-        if os.path.exists(html_file):
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            # 修改HTML中的fetch路径，使其指向Flask API
-            html_content = html_content.replace(
-                "fetch('ocs_answers_log.csv')",
-                "fetch('/api/csv')"
-            )
-            html_content = html_content.replace(
-                'fetch("ocs_answers_log.csv")',
-                'fetch("/api/csv")'
-            )
-            html_content = html_content.replace(
-                '<script src="chart.js.min.js"></script>',
-                '<script src="https://cdn.jsdelivr.net/npm/chart.js@4.4.0/dist/chart.umd.min.js"></script>'
-            )
-            
-            response = make_response(html_content)
-            response.headers['Content-Type'] = 'text/html; charset=utf-8'
-            return response
-        else:
-            return jsonify({"error": "可视化页面文件不存在"}), 404
+        # 替换后的页面随文件缓存，文件不变时不再重复替换
+        return _html_page_response(html_file, _patch_viewer_html)
+    except FileNotFoundError:
+        return jsonify({"error": "可视化页面文件不存在"}), 404
     except Exception as e:
         logger.error(f"加载可视化页面失败: {str(e)}")
         return jsonify({"error": f"加载可视化页面失败: {str(e)}"}), 500
@@ -3399,15 +4539,9 @@ def api_docs_legacy():
     html_file = os.path.join(os.path.dirname(__file__), 'api_docs.html')
     
     try:
-        if os.path.exists(html_file):
-            with open(html_file, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-            
-            response = make_response(html_content)
-            response.headers['Content-Type'] = 'text/html; charset=utf-8'
-            return response
-        else:
-            return jsonify({"error": "API文档文件不存在"}), 404
+        return _html_page_response(html_file)
+    except FileNotFoundError:
+        return jsonify({"error": "API文档文件不存在"}), 404
     except Exception as e:
         logger.error(f"加载API文档失败: {str(e)}")
         return jsonify({"error": f"加载API文档失败: {str(e)}"}), 500
@@ -9,12 +9,95 @@ import requests
 import json
 import sys
 import os
-from datetime import datetime
+import argparse
+import time
+import hashlib
+import sqlite3
+import threading
+import functools
+import base64
+import unicodedata
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# 可选依赖：orjson（更快的JSON编解码）
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+# 可选依赖：httpx + h2（HTTPS部署时批量模式通过单条HTTP/2连接多路复用）
+try:
+    import httpx
+    import h2  # noqa: F401  httpx的HTTP/2支持依赖h2
+    _HAS_HTTP2 = True
+except ImportError:
+    _HAS_HTTP2 = False
 
 # API配置
 API_BASE = "http://localhost:5000"
 API_KEY = ""  # 如果需要认证，请填入API密钥
 
+# 全局会话：复用keep-alive连接，避免每道题重新建立TCP连接
+# 重试策略：连接失败和网关错误（服务重启、反向代理503等）按指数退避重试；
+# 读超时不重试，避免慢请求被重复答题、重复消耗token；
+# 重试耗尽后返回最后一次响应，由调用方按状态码处理
+RETRY_POLICY = Retry(
+    total=3,
+    read=0,
+    backoff_factor=0.3,
+    status_forcelist=(502, 503, 504),
+    allowed_methods=frozenset(["POST"]),
+    respect_retry_after_header=True,
+    raise_on_status=False
+)
+
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=RETRY_POLICY)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
+SESSION.headers.update({
+    "Content-Type": "application/json",
+    "Connection": "keep-alive"
+})
+
+# 批量模式下同时在途的请求数
+BATCH_CONCURRENCY = 5
+
+# 图片题预取：提前并发下载图片并以data URI内联提交，服务器无需再下载
+# 默认关闭（--prefetch-images 开启）：内联后请求体变大，服务器选择不支持图片的模型时是白白上传
+PREFETCH_IMAGES = False
+IMAGE_PREFETCH_WORKERS = 4  # 同时下载的图片数，避免对图床并发过高
+
+# 图片题分块上传：先发送题干等小字段，再发送图片，需要服务器/反向代理支持分块传输（--stream-body 开启）
+STREAM_REQUEST_BODY = False
+
+# 本地答案缓存：相同服务器、相同题目在有效期内直接返回，不再请求后端
+# 默认关闭（测试脚本应当真正请求服务器），调试时用 --cache 开启
+CACHE_FILE = '.test_question_cache.sqlite'
+CACHE_TTL = 4 * 3600  # 秒
+USE_CACHE = False
+# 相似题目缓存：题型/选项/图片完全相同，且题干去掉空白和标点后完全相同时复用答案
+# 只做规范化后的精确匹配，不做模糊匹配（"200表示什么"和"404表示什么"只差几个字却答案不同）
+# 默认关闭，用 --similar-cache 开启（隐含 --cache）
+USE_SIMILAR_CACHE = False
+_cache_conn = None
+_cache_lock = threading.Lock()
+
+# 批量模式的HTTP/2客户端（懒加载）
+_http2_client = None
+_http2_lock = threading.Lock()
+
+# 请求超时/连接失败异常（requests 与 httpx 两条路径共用）
+_TIMEOUT_ERRORS = (requests.exceptions.Timeout,)
+_CONNECT_ERRORS = (requests.exceptions.ConnectionError,)
+if _HAS_HTTP2:
+    _TIMEOUT_ERRORS += (httpx.TimeoutException,)
+    _CONNECT_ERRORS += (httpx.ConnectError,)
+
 # 测试题目库
 TEST_QUESTIONS = {
     0: {  # 单选题
@@ -116,42 +199,56 @@ IMAGE_QUESTIONS = [
 ]
 
 
+# 静态横幅和菜单，启动时拼好，打印时一次写出
+_HEADER = "\n" + "=" * 80 + "\n🤖 OCS AI 答题测试脚本\n" + "=" * 80 + "\n"
+
+_MENU = (
+    "\n📝 请选择要测试的题型：\n"
+    "  0 - 单选题\n"
+    "  1 - 多选题\n"
+    "  3 - 填空题\n"
+    "  4 - 判断题\n"
+    "  5 - 图片题（需要多模态模型）\n"
+    "  6 - 自定义题目\n"
+    "  q - 退出\n"
+    + "-" * 80 + "\n"
+)
+
+
 def print_header():
     """打印标题"""
-    print("\n" + "=" * 80)
-    print("🤖 OCS AI 答题测试脚本")
-    print("=" * 80)
+    sys.stdout.write(_HEADER)
 
 
 def print_menu():
     """打印菜单"""
-    print("\n📝 请选择要测试的题型：")
-    print("  0 - 单选题")
-    print("  1 - 多选题")
-    print("  3 - 填空题")
-    print("  4 - 判断题")
-    print("  5 - 图片题（需要多模态模型）")
-    print("  6 - 自定义题目")
-    print("  q - 退出")
-    print("-" * 80)
+    sys.stdout.write(_MENU)
+
 
+@functools.lru_cache(maxsize=1)
+def _load_key(path, mtime):
+    """读取密钥文件中的原始密钥（按路径和修改时间缓存，文件未变化时不重复解析）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get('raw_key', '')
 
-def load_api_key():
-    """从.secret_key文件加载API密钥"""
+
+def load_api_key(interactive=True):
+    """从.secret_key文件加载API密钥（interactive=False 时不提示输入）"""
     global API_KEY
     
     secret_file = '.secret_key'
     if os.path.exists(secret_file):
         try:
-            with open(secret_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                API_KEY = data.get('raw_key', '')
-                if API_KEY:
-                    print(f"✅ 已加载API密钥: {API_KEY[:8]}...")
-                    return True
+            API_KEY = _load_key(secret_file, os.path.getmtime(secret_file))
+            if API_KEY:
+                print(f"✅ 已加载API密钥: {API_KEY[:8]}...")
+                return True
         except Exception as e:
             print(f"⚠️  加载API密钥失败: {e}")
     
+    if not interactive:
+        return False
+    
     # 尝试从用户输入获取
     print("\n🔐 未找到API密钥文件，请输入API密钥（如果不需要认证，直接回车）：")
     key = input("API密钥: ").strip()
@@ -162,123 +259,496 @@ def load_api_key():
     return False
 
 
-def call_api(question_data):
-    """调用答题API"""
-    url = f"{API_BASE}/api/answer"
-    headers = {
-        "Content-Type": "application/json"
-    }
+def _json_dumps(obj):
+    """序列化为UTF-8 JSON字节（有orjson时使用orjson）"""
+    if _HAS_ORJSON:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _json_loads(data):
+    """解析JSON字节（有orjson时使用orjson）"""
+    if _HAS_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _body_digest(question_data):
+    """题目内容摘要：规范化JSON的SHA-256"""
+    canonical = json.dumps(question_data, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+# 内置题目是静态的，启动时预先序列化好请求体，答题时直接发送
+TEST_QUESTIONS_ENCODED = {
+    type_num: [_json_dumps(q) for q in type_data['questions']]
+    for type_num, type_data in TEST_QUESTIONS.items()
+}
+
+# 预序列化请求体 -> 题目内容摘要，开启缓存时免去每次计算缓存键的序列化和哈希
+_PAYLOAD_DIGESTS = {
+    payload: _body_digest(q)
+    for type_num, type_data in TEST_QUESTIONS.items()
+    for q, payload in zip(type_data['questions'], TEST_QUESTIONS_ENCODED[type_num])
+}
+
+
+def _get_cache():
+    """懒加载缓存数据库连接（批量模式下多线程共享，需持锁使用）"""
+    global _cache_conn
+    if _cache_conn is None:
+        _cache_conn = sqlite3.connect(CACHE_FILE, check_same_thread=False)
+        _cache_conn.execute("CREATE TABLE IF NOT EXISTS c(k TEXT PRIMARY KEY, v BLOB, ts INT)")
+        _cache_conn.execute("CREATE TABLE IF NOT EXISTS norm(ns TEXT, q TEXT, v BLOB, ts INT, "
+                            "PRIMARY KEY(ns, q))")
+    return _cache_conn
+
+
+def _cache_key(question_data, digest=None):
+    """
+    题目的缓存键：服务器地址 + 题目内容摘要（切换服务器后不会命中旧结果）
     
-    if API_KEY:
-        headers["X-API-Key"] = API_KEY
+    digest 为预先算好的内容摘要，未提供时现场计算。
+    """
+    return f"{API_BASE}\n{digest or _body_digest(question_data)}"
+
+
+def _similar_namespace(question_data):
+    """相似缓存的命名空间：除题干外的全部字段（题型、选项、图片）及服务器地址"""
+    rest = {k: v for k, v in question_data.items() if k != 'question'}
+    return _cache_key(rest)
+
+
+def _normalize_question(text):
+    """去掉题干中的空白和标点（全角/半角一视同仁），用于相似缓存的精确匹配"""
+    return ''.join(
+        ch for ch in str(text)
+        if not ch.isspace() and not unicodedata.category(ch).startswith('P')
+    )
+
+
+def _similar_cache_get(question_data):
+    """查找规范化题干完全相同的未过期结果，未命中返回None"""
+    question = _normalize_question(question_data.get('question', ''))
+    if not question:
+        return None
+    try:
+        with _cache_lock:
+            row = _get_cache().execute(
+                "SELECT v FROM norm WHERE ns=? AND q=? AND ts>?",
+                (_similar_namespace(question_data), question, int(time.time() - CACHE_TTL))
+            ).fetchone()
+    except sqlite3.Error:
+        return None
+    return json.loads(row[0]) if row else None
+
+
+def _cache_get(key):
+    """读取未过期的缓存结果，未命中返回None"""
+    try:
+        with _cache_lock:
+            row = _get_cache().execute("SELECT v, ts FROM c WHERE k=?", (key,)).fetchone()
+    except sqlite3.Error:
+        return None
+    if row and time.time() - row[1] < CACHE_TTL:
+        return json.loads(row[0])
+    return None
+
+
+def _cache_put(key, question_data, result):
+    """写入精确缓存和相似缓存（失败时忽略，不影响答题）"""
+    value = json.dumps(result, ensure_ascii=False)
+    now = int(time.time())
+    try:
+        with _cache_lock:
+            conn = _get_cache()
+            conn.execute("INSERT OR REPLACE INTO c VALUES(?,?,?)", (key, value, now))
+            question = _normalize_question(question_data.get('question', ''))
+            if question:
+                conn.execute("INSERT OR REPLACE INTO norm VALUES(?,?,?,?)",
+                             (_similar_namespace(question_data), question, value, now))
+            conn.commit()
+    except sqlite3.Error:
+        pass
+
+
+def _get_http2_client():
+    """
+    获取批量模式使用的HTTP/2客户端
+    
+    HTTP/2需要TLS协商，只有API_BASE为https且安装了httpx[http2]时才启用，
+    否则返回None，批量模式继续使用requests会话的连接池。
+    """
+    global _http2_client
+    if not _HAS_HTTP2 or not API_BASE.startswith('https://'):
+        return None
+    with _http2_lock:
+        if _http2_client is None:
+            # Connection 是HTTP/1.1专用头，HTTP/2中禁止携带
+            headers = {k: v for k, v in SESSION.headers.items() if k.lower() != 'connection'}
+            _http2_client = httpx.Client(
+                http2=True,
+                headers=headers,
+                timeout=httpx.Timeout(60.0),
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=8)
+            )
+    return _http2_client
+
+
+class _ChunkedBody:
+    """
+    分块上传的请求体：第一块为不含图片的JSON字段，第二块为图片列表
+    
+    必须可重复迭代：会话的重试策略遇到502/503/504时，urllib3会重新迭代同一个请求体，
+    一次性的生成器在重试时已耗尽，会发出空请求体。
+    """
+    
+    def __init__(self, question_data):
+        head = {k: v for k, v in question_data.items() if k != 'images'}
+        self._chunks = (
+            _json_dumps(head)[:-1],
+            b',"images":' + _json_dumps(question_data['images']) + b'}',
+        )
+    
+    def __iter__(self):
+        return iter(self._chunks)
+
+
+def _send_question(url, question_data, client, payload):
+    """发送答题请求，返回响应对象"""
+    # 分块上传只用于带图片的题目，且仅走requests会话
+    if STREAM_REQUEST_BODY and client is None and payload is None \
+            and question_data.get('images') and len(question_data) > 1:
+        response = SESSION.post(url, data=_ChunkedBody(question_data), timeout=60)
+        # 411 表示中间代理不接受分块请求体，回退为普通请求
+        if response.status_code != 411:
+            return response
+    
+    # Content-Type 已在会话默认头中设置
+    if payload is None:
+        payload = _json_dumps(question_data)
+    if client is not None:
+        return client.post(url, content=payload)
+    return SESSION.post(url, data=payload, timeout=60)
+
+
+def _post_question(question_data, client=None, payload=None):
+    """
+    提交一道题目，返回 (success, result, elapsed)
+    
+    client 为HTTP/2客户端时走httpx；payload 为预先序列化的请求体，未提供时现场序列化。
+    """
+    url = f"{API_BASE}/api/answer"
     
     try:
-        print(f"\n⏳ 正在调用AI模型...")
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
-        response = requests.post(url, json=question_data, headers=headers, timeout=60)
+        cache_key = None
+        if USE_CACHE:
+            digest = _PAYLOAD_DIGESTS.get(payload) if payload is not None else None
+            cache_key = _cache_key(question_data, digest)
+        if cache_key:
+            cached = _cache_get(cache_key)
+            if cached is not None:
+                cached['_cache_hit'] = 'exact'
+                return True, cached, time.perf_counter() - start_time
+            cached = _similar_cache_get(question_data) if USE_SIMILAR_CACHE else None
+            if cached is not None:
+                cached['_cache_hit'] = 'similar'
+                return True, cached, time.perf_counter() - start_time
         
-        end_time = datetime.now()
-        elapsed = (end_time - start_time).total_seconds()
+        response = _send_question(url, question_data, client, payload)
         
+        elapsed = time.perf_counter() - start_time
+        
+        # 只解析一次响应体，成功和失败分支共用
+        body = _json_loads(response.content) if response.content else {}
         if response.status_code == 200:
-            result = response.json()
-            return True, result, elapsed
+            if cache_key:
+                _cache_put(cache_key, question_data, body)
+            return True, body, elapsed
         else:
-            error_msg = response.json().get('error', '未知错误')
-            return False, error_msg, elapsed
+            return False, body.get('error', '未知错误'), elapsed
             
-    except requests.exceptions.Timeout:
+    except _TIMEOUT_ERRORS:
         return False, "请求超时（60秒）", 0
-    except requests.exceptions.ConnectionError:
+    except _CONNECT_ERRORS:
         return False, f"无法连接到服务器 {API_BASE}", 0
     except Exception as e:
         return False, str(e), 0
 
 
-def display_result(success, result, elapsed):
-    """显示结果"""
-    print("\n" + "=" * 80)
+def preconnect():
+    """
+    后台预先建立到服务器的keep-alive连接
+    
+    用户看菜单、选题型的时间里完成TCP握手，第一道题直接复用连接池中的空闲连接。
+    失败时静默忽略，不影响后续答题。
+    """
+    def _warm():
+        try:
+            SESSION.head(f"{API_BASE}/api/health", timeout=2)
+        except requests.exceptions.RequestException:
+            pass
+    
+    threading.Thread(target=_warm, daemon=True).start()
+
+
+def call_api(question_data, payload=None):
+    """调用答题API（payload 为可选的预序列化请求体）"""
+    print(f"\n⏳ 正在调用AI模型...")
+    return _post_question(question_data, payload=payload)
+
+
+def call_api_concurrent(questions, payloads=None):
+    """并发调用答题API，按题目顺序返回 (success, result, elapsed) 列表"""
+    print(f"\n⏳ 正在并发调用AI模型（{len(questions)} 道题，并发数 {BATCH_CONCURRENCY}）...")
+    client = _get_http2_client()
+    if payloads is None:
+        payloads = [None] * len(questions)
+    with ThreadPoolExecutor(max_workers=BATCH_CONCURRENCY) as executor:
+        return list(executor.map(lambda q, p: _post_question(q, client, p), questions, payloads))
+
+
+def call_api_batch(questions):
+    """
+    调用批量答题API（/api/answer_batch），所有题目合并为一次请求
+    
+    返回与 call_api_concurrent 相同格式的列表；整批失败时每道题都记为失败。
+    模型、提供商、用时等整批共享的字段会合并到每道题的结果中。
+    """
+    url = f"{API_BASE}/api/answer_batch"
+    print(f"\n⏳ 正在批量调用AI模型（{len(questions)} 道题合并为一次请求）...")
+    
+    try:
+        start_time = time.perf_counter()
+        response = SESSION.post(url, data=_json_dumps({"batch": questions}), timeout=60)
+        elapsed = time.perf_counter() - start_time
+        
+        body = _json_loads(response.content) if response.content else {}
+        if response.status_code != 200:
+            return [(False, body.get('error', '未知错误'), elapsed)] * len(questions)
+    except _TIMEOUT_ERRORS:
+        return [(False, "请求超时（60秒）", 0)] * len(questions)
+    except _CONNECT_ERRORS:
+        return [(False, f"无法连接到服务器 {API_BASE}", 0)] * len(questions)
+    except Exception as e:
+        return [(False, str(e), 0)] * len(questions)
     
+    usage = body.get('usage', {})
+    if usage:
+        print(f"💰 整批Token使用: 输入={usage.get('prompt_tokens', 0)}, "
+              f"输出={usage.get('completion_tokens', 0)}, "
+              f"总计={usage.get('total_tokens', 0)}")
+    
+    shared = {k: body[k] for k in ('model', 'provider', 'reasoning_used', 'ai_time') if k in body}
+    results = []
+    for item in body.get('results', []):
+        if item.get('success'):
+            results.append((True, {**item, **shared}, elapsed))
+        else:
+            results.append((False, "AI未作答", elapsed))
+    # 服务端返回条数不足时补齐，保证与题目一一对应
+    results += [(False, "服务器未返回该题结果", elapsed)] * (len(questions) - len(results))
+    return results
+
+
+def ask_batch_mode(allow_merge=False):
+    """
+    询问运行模式
+    
+    Returns:
+        str: 'concurrent' 批量并发提交，'merge' 合并为一次批量请求（仅纯文本题），'step' 逐题确认
+    """
+    if allow_merge:
+        prompt = "\n直接回车批量并发提交，输入 m 合并为一次请求，输入 s 逐题确认: "
+    else:
+        prompt = "\n直接回车批量并发提交，输入 s 逐题确认: "
+    choice = input(prompt).strip().lower()
+    if choice == 's':
+        return 'step'
+    if choice == 'm' and allow_merge:
+        return 'merge'
+    return 'concurrent'
+
+
+# 答题结果模板，启动时拼好，显示时一次格式化
+_RESULT_TMPL = (
+    "\n" + "=" * 80 + "\n"
+    "✅ 答题成功！\n"
+    + "-" * 80 + "\n"
+    "📝 题目: {question}\n"
+    "✨ AI答案: {answer}\n"
+    "🤖 原始回答: {raw_answer}\n"
+    "🎯 使用模型: {model}\n"
+    "🏢 提供商: {provider}\n"
+    "🧠 思考模式: {reasoning_used_text}\n"
+    "⏱️  AI用时: {ai_time:.2f}秒\n"
+    "⏱️  总用时: {elapsed:.2f}秒\n"
+)
+
+_FAILURE_TMPL = (
+    "\n" + "=" * 80 + "\n"
+    "❌ 答题失败！\n"
+    + "-" * 80 + "\n"
+    "错误信息: {error}\n"
+    "用时: {elapsed:.2f}秒\n"
+)
+
+_RESULT_FOOTER = "=" * 80 + "\n"
+
+
+def display_result(success, result, elapsed):
+    """显示结果（按模板格式化后一次写出）"""
     if success:
-        print("✅ 答题成功！")
-        print("-" * 80)
-        print(f"📝 题目: {result.get('question', 'N/A')}")
-        print(f"✨ AI答案: {result.get('answer', 'N/A')}")
-        print(f"🤖 原始回答: {result.get('raw_answer', 'N/A')}")
-        print(f"🎯 使用模型: {result.get('model', 'N/A')}")
-        print(f"🏢 提供商: {result.get('provider', 'N/A')}")
-        print(f"🧠 思考模式: {'是' if result.get('reasoning_used') else '否'}")
-        print(f"⏱️  AI用时: {result.get('ai_time', 0):.2f}秒")
-        print(f"⏱️  总用时: {elapsed:.2f}秒")
+        # 缺失字段显示为 N/A
+        fields = defaultdict(lambda: 'N/A', result)
+        fields['reasoning_used_text'] = '是' if result.get('reasoning_used') else '否'
+        fields['ai_time'] = result.get('ai_time', 0)
+        fields['elapsed'] = elapsed
+        parts = [_RESULT_TMPL.format_map(fields)]
+        
+        cache_hit = result.get('_cache_hit')
+        if cache_hit == 'similar':
+            parts.append("💾 缓存: HIT（题干仅空白/标点不同的已缓存题目，未请求服务器）\n")
+        elif cache_hit:
+            parts.append("💾 缓存: HIT（本地缓存结果，未请求服务器）\n")
         
         # Token使用量
         usage = result.get('usage', {})
         if usage:
-            print(f"💰 Token使用: 输入={usage.get('prompt_tokens', 0)}, "
-                  f"输出={usage.get('completion_tokens', 0)}, "
-                  f"总计={usage.get('total_tokens', 0)}")
+            parts.append(f"💰 Token使用: 输入={usage.get('prompt_tokens', 0)}, "
+                         f"输出={usage.get('completion_tokens', 0)}, "
+                         f"总计={usage.get('total_tokens', 0)}\n")
     else:
-        print("❌ 答题失败！")
-        print("-" * 80)
-        print(f"错误信息: {result}")
-        print(f"用时: {elapsed:.2f}秒")
+        parts = [_FAILURE_TMPL.format(error=result, elapsed=elapsed)]
     
-    print("=" * 80)
+    parts.append(_RESULT_FOOTER)
+    sys.stdout.write("".join(parts))
 
 
-def test_question_type(type_num):
-    """测试指定题型"""
+def test_question_type(type_num, mode=None):
+    """测试指定题型（mode 为 None 时询问运行模式）"""
     if type_num not in TEST_QUESTIONS:
         print(f"❌ 无效的题型编号: {type_num}")
         return
     
     type_data = TEST_QUESTIONS[type_num]
+    questions = type_data['questions']
+    payloads = TEST_QUESTIONS_ENCODED[type_num]
+    total = len(questions)
+    rule = '=' * 80
     print(f"\n📚 测试题型: {type_data['name']}")
-    print(f"共有 {len(type_data['questions'])} 道题目")
+    print(f"共有 {total} 道题目")
+    
+    if mode is None:
+        mode = ask_batch_mode(allow_merge=True)
+    batch = mode != 'step'
+    if mode == 'merge':
+        results = call_api_batch(questions)
+    elif mode == 'concurrent':
+        results = call_api_concurrent(questions, payloads)
+    else:
+        results = None
     
-    for i, question in enumerate(type_data['questions'], 1):
-        print(f"\n{'=' * 80}")
-        print(f"第 {i}/{len(type_data['questions'])} 题")
-        print(f"{'=' * 80}")
+    for i, (question, payload) in enumerate(zip(questions, payloads), 1):
+        options = question['options']
+        print(f"\n{rule}")
+        print(f"第 {i}/{total} 题")
+        print(rule)
         print(f"题目: {question['question']}")
-        if question['options']:
-            print(f"选项: {' | '.join(question['options'])}")
+        if options:
+            print(f"选项: {' | '.join(options)}")
         
-        # 调用API
-        success, result, elapsed = call_api(question)
+        # 调用API（批量模式下结果已提前取回）
+        if batch:
+            success, result, elapsed = results[i - 1]
+        else:
+            success, result, elapsed = call_api(question, payload)
         display_result(success, result, elapsed)
         
         # 询问是否继续
-        if i < len(type_data['questions']):
+        if not batch and i < total:
             choice = input("\n按回车继续下一题，输入 q 返回菜单: ").strip().lower()
             if choice == 'q':
                 break
 
 
-def test_image_questions():
-    """测试图片题"""
+def _download_image(url):
+    """下载图片并转换为data URI，失败返回None（不使用SESSION，避免把API密钥发给图床）"""
+    try:
+        response = requests.get(url, timeout=10)
+        response.raise_for_status()
+    except requests.exceptions.RequestException:
+        return None
+    content_type = response.headers.get('Content-Type', 'image/jpeg')
+    if 'image/' not in content_type:
+        content_type = 'image/jpeg'
+    return f"data:{content_type};base64,{base64.b64encode(response.content).decode('ascii')}"
+
+
+def _inline_images(question, prefetched):
+    """用预取结果替换题目中的图片URL，下载失败的图片保留原URL交给服务器处理"""
+    if not prefetched:
+        return question
+    images = [prefetched[url].result() or url for url in question['images']]
+    return {**question, "images": images}
+
+
+def test_image_questions(mode=None):
+    """测试图片题（mode 为 None 时询问运行模式；图片题不支持合并请求，按并发处理）"""
+    total = len(IMAGE_QUESTIONS)
+    rule = '=' * 80
     print(f"\n📷 测试图片题")
-    print(f"共有 {len(IMAGE_QUESTIONS)} 道题目")
+    print(f"共有 {total} 道题目")
     print("⚠️  注意：需要配置支持多模态的模型（如豆包）")
     
-    for i, question in enumerate(IMAGE_QUESTIONS, 1):
-        print(f"\n{'=' * 80}")
-        print(f"第 {i}/{len(IMAGE_QUESTIONS)} 题")
-        print(f"{'=' * 80}")
-        print(f"题目: {question['question']}")
-        print(f"选项: {' | '.join(question['options'])}")
-        print(f"图片: {', '.join(question['images'])}")
-        
-        # 调用API
-        success, result, elapsed = call_api(question)
-        display_result(success, result, elapsed)
+    if mode is None:
+        mode = ask_batch_mode()
+    elif mode == 'merge':
+        mode = 'concurrent'
+    batch = mode != 'step'
+    
+    # 所有图片在后台并发下载，逐题模式下与前面题目的答题过程重叠
+    prefetched = {}
+    pool = ThreadPoolExecutor(max_workers=IMAGE_PREFETCH_WORKERS) if PREFETCH_IMAGES else None
+    if pool:
+        for question in IMAGE_QUESTIONS:
+            for url in question['images']:
+                if url not in prefetched:
+                    prefetched[url] = pool.submit(_download_image, url)
+    
+    try:
+        results = None
+        if batch:
+            results = call_api_concurrent([_inline_images(q, prefetched) for q in IMAGE_QUESTIONS])
         
-        # 询问是否继续
-        if i < len(IMAGE_QUESTIONS):
-            choice = input("\n按回车继续下一题，输入 q 返回菜单: ").strip().lower()
-            if choice == 'q':
-                break
+        for i, question in enumerate(IMAGE_QUESTIONS, 1):
+            print(f"\n{rule}")
+            print(f"第 {i}/{total} 题")
+            print(rule)
+            print(f"题目: {question['question']}")
+            print(f"选项: {' | '.join(question['options'])}")
+            print(f"图片: {', '.join(question['images'])}")
+            
+            # 调用API（批量模式下结果已提前取回）
+            if batch:
+                success, result, elapsed = results[i - 1]
+            else:
+                success, result, elapsed = call_api(_inline_images(question, prefetched))
+            display_result(success, result, elapsed)
+            
+            # 询问是否继续
+            if not batch and i < total:
+                choice = input("\n按回车继续下一题，输入 q 返回菜单: ").strip().lower()
+                if choice == 'q':
+                    break
+    finally:
+        if pool:
+            # 取消尚未开始的下载（cancel_futures 参数需要 Python 3.9+，这里手动取消）
+            for future in prefetched.values():
+                future.cancel()
+            pool.shutdown(wait=False)
 
 
 def test_custom_question():
@@ -345,15 +815,17 @@ def test_custom_question():
             question_data["images"] = images
     
     # 显示题目信息
-    print(f"\n{'=' * 80}")
+    rule = '=' * 80
+    images = question_data.get('images')
+    print(f"\n{rule}")
     print("题目信息：")
     print(f"题型: {TEST_QUESTIONS[type_num]['name']}")
     print(f"题目: {question_text}")
     if options:
         print(f"选项: {' | '.join(options)}")
-    if question_data.get('images'):
-        print(f"图片: {', '.join(question_data['images'])}")
-    print(f"{'=' * 80}")
+    if images:
+        print(f"图片: {', '.join(images)}")
+    print(rule)
     
     # 确认提交
     confirm = input("\n确认提交？(y/n): ").strip().lower()
@@ -366,32 +838,82 @@ def test_custom_question():
     display_result(success, result, elapsed)
 
 
-def main():
+# 菜单选项 -> 处理函数（参数为运行模式，None 表示交互询问）
+HANDLERS = {
+    '0': functools.partial(test_question_type, 0),
+    '1': functools.partial(test_question_type, 1),
+    '3': functools.partial(test_question_type, 3),
+    '4': functools.partial(test_question_type, 4),
+    '5': test_image_questions,
+    '6': lambda mode: test_custom_question(),
+}
+
+
+def parse_args(argv=None):
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="OCS AI 答题测试脚本")
+    parser.add_argument("-y", "--yes", action="store_true",
+                        help="跳过所有确认提示，题目并发提交后一次跑完（适合CI）")
+    parser.add_argument("--batch", action="store_true",
+                        help="同一题型的题目合并为一次 /api/answer_batch 请求（隐含 --yes）")
+    parser.add_argument("--type", type=int, choices=[0, 1, 3, 4, 5],
+                        help="直接测试指定题型后退出，不显示菜单（5 为图片题）")
+    parser.add_argument("--cache", action="store_true",
+                        help="启用本地答案缓存（有效期内相同题目不再请求服务器，仅用于调试脚本本身）")
+    parser.add_argument("--similar-cache", action="store_true",
+                        help="缓存同时匹配仅空白/标点不同的题干（隐含 --cache）")
+    parser.add_argument("--prefetch-images", action="store_true",
+                        help="图片题在本地预先下载并内联为data URI提交，服务器不再下载图片")
+    parser.add_argument("--stream-body", action="store_true",
+                        help="图片题分块上传请求体（需要服务器/反向代理支持分块传输）")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
     """主函数"""
+    global USE_CACHE, USE_SIMILAR_CACHE, PREFETCH_IMAGES, STREAM_REQUEST_BODY
+    args = parse_args(argv)
+    if args.prefetch_images:
+        PREFETCH_IMAGES = True
+    if args.cache or args.similar_cache:
+        USE_CACHE = True
+    if args.similar_cache:
+        USE_SIMILAR_CACHE = True
+    if args.stream_body:
+        STREAM_REQUEST_BODY = True
+    
+    # 非交互模式下运行模式固定，不再逐题询问
+    if args.batch:
+        mode = 'merge'
+    elif args.yes:
+        mode = 'concurrent'
+    else:
+        mode = None
+    
     print_header()
     
     # 加载API密钥
-    load_api_key()
+    load_api_key(interactive=mode is None)
+    if API_KEY:
+        SESSION.headers["X-API-Key"] = API_KEY
+    preconnect()
+    
+    # 指定题型时直接运行，不进入菜单
+    if args.type is not None:
+        HANDLERS[str(args.type)](mode)
+        return
     
     # 主循环
     while True:
         print_menu()
         choice = input("请选择 (0-6/q): ").strip().lower()
         
-        if choice == 'q':
+        handler = HANDLERS.get(choice)
+        if handler:
+            handler(mode)
+        elif choice == 'q':
             print("\n👋 再见！")
             break
-        
-        if choice == '5':
-            test_image_questions()
-        elif choice == '6':
-            test_custom_question()
-        elif choice in ['0', '1', '3', '4']:
-            try:
-                type_num = int(choice)
-                test_question_type(type_num)
-            except ValueError:
-                print("❌ 无效的输入")
         else:
             print("❌ 无效的选择，请输入 0-6 或 q")
 
@@ -402,3 +924,9 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         print("\n\n👋 已中断，再见！")
         sys.exit(0)
+    finally:
+        SESSION.close()
+        if _http2_client is not None:
+            _http2_client.close()
+        if _cache_conn is not None:
+            _cache_conn.close()